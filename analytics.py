@@ -0,0 +1,128 @@
+"""
+来店の集計（集計メニュー用）
+
+- 月別・曜日別の来店数、担当別の来店数と延長回数、イベント別の来店数と顧客数
+- どれも「件数・合計」の足し算でできているので、変わった行の分だけ引いて足せば更新できる
+- visit の版が変わったら、変わった行がわかれば差分更新、わからなければ作り直す
+"""
+import threading
+
+import pandas as pd
+
+from data_store import VISIT_KEY, WEEKDAYS
+
+PARTS = ("month", "month_ext", "weekday", "staff", "staff_ext", "event_customer")
+
+
+def _aggregate(df):
+    """
+    有効な来店行の件数・合計（集計キー → 値の Series）
+    df は型付きの visit_df（来店日は datetime64、延長回数は Int16）
+    """
+    active = df[(df["削除"] != "1").to_numpy() & df["来店日"].notna().to_numpy()]
+    month = active["来店日"].dt.to_period("M")
+    staff = active["担当_氏名"].replace("", "（未設定）")
+    ext = active["延長回数"].fillna(0).astype("int64")
+    events = active[active["イベント名"] != ""]
+
+    return {
+        "month": active.groupby(month).size(),
+        "month_ext": ext.groupby(month).sum(),
+        "weekday": active.groupby(active["来店日"].dt.dayofweek).size(),
+        "staff": active.groupby(staff).size(),
+        "staff_ext": ext.groupby(staff).sum(),
+        # 顧客数は足し算できないので (イベント名, 顧客_ID) ごとの件数で持つ
+        "event_customer": events.groupby(["イベント名", "顧客_ID"]).size(),
+    }
+
+
+def _combine(base, plus, minus):
+    result = base.sub(minus, fill_value=0).add(plus, fill_value=0)
+    return result[result != 0].astype("int64")
+
+
+class VisitStats:
+    """
+    df    … この集計のもとになった型付き visit_df（読み取り専用）
+    parts … PARTS ごとの件数・合計
+    """
+
+    def __init__(self, df, parts=None):
+        self.df = df
+        self.parts = _aggregate(df) if parts is None else parts
+
+    def updated(self, df, keys):
+        """
+        keys（変わった 来店履歴_ID）の分だけ差し替えた集計
+        keys が None なら作り直す
+        """
+        if keys is None:
+            return VisitStats(df)
+
+        keys = list(keys)
+        old = _aggregate(self.df[self.df[VISIT_KEY].astype(str).isin(keys)])
+        new = _aggregate(df[df[VISIT_KEY].astype(str).isin(keys)])
+        parts = {name: _combine(self.parts[name], new[name], old[name]) for name in PARTS}
+        return VisitStats(df, parts)
+
+    # =====================
+    # 表示用
+    # =====================
+    def monthly(self):
+        """
+        月・来店数・延長回数（新しい月から）
+        """
+        df = pd.DataFrame({"来店数": self.parts["month"], "延長回数": self.parts["month_ext"]})
+        df = df.fillna(0).astype("int64").sort_index(ascending=False)
+        df.index = df.index.astype(str)
+        return df.rename_axis("月").reset_index()
+
+    def weekdays(self):
+        """
+        曜日・来店数（月曜から）
+        """
+        counts = self.parts["weekday"].reindex(range(7), fill_value=0).astype("int64")
+        return pd.DataFrame({"曜日": WEEKDAYS, "来店数": counts.to_numpy()})
+
+    def staff(self):
+        """
+        担当・来店数・延長回数・平均延長（来店数の多い順）
+        """
+        df = pd.DataFrame({"来店数": self.parts["staff"], "延長回数": self.parts["staff_ext"]})
+        df = df.fillna(0).astype("int64").sort_values("来店数", ascending=False)
+        df["平均延長"] = (df["延長回数"] / df["来店数"]).round(2)
+        return df.rename_axis("担当").reset_index()
+
+    def events(self):
+        """
+        イベント名・来店数・顧客数（来店数の多い順）
+        """
+        pairs = self.parts["event_customer"]
+        if pairs.empty:
+            return pd.DataFrame(columns=["イベント名", "来店数", "顧客数"])
+
+        by_event = pairs.groupby(level=0)
+        df = pd.DataFrame({"来店数": by_event.sum(), "顧客数": by_event.size()})
+        df = df.sort_values("来店数", ascending=False)
+        return df.rename_axis("イベント名").reset_index()
+
+
+class StatsCache:
+    """
+    プロセスで1つ持つ最新の VisitStats
+    版が進んだら changes_since(前の版, 新しい版) で変わった行を聞いて差分更新する
+    """
+
+    def __init__(self):
+        self.version = None
+        self.stats = None
+        self._lock = threading.Lock()
+
+    def get(self, df, version, changes_since):
+        with self._lock:
+            if self.stats is None or self.version is None or version < self.version:
+                self.stats = VisitStats(df)
+            elif version != self.version:
+                self.stats = self.stats.updated(df, changes_since(self.version, version))
+            self.version = version
+            return self.stats
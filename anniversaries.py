@@ -0,0 +1,82 @@
+"""
+誕生日・初回来店の記念日インデックス
+
+- 月日を「うるう年の暦での通し日（0〜365）」に直し、通し日ごとの行位置をまとめておく
+- 「今日から N 日以内」は N 日分の通し日を引くだけ（件数ぶんの手間）
+- 2/29 生まれは、うるう年以外は 2/28 に出す
+- 年末から年始にまたがる範囲も、実際の日付を1日ずつ進めるのでそのまま扱える
+"""
+from calendar import isleap
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+KINDS = {"誕生日": "生年月日", "来店記念日": "初回来店日"}
+
+DAYS = 366
+FEB29 = 31 + 28
+
+
+def day_number(month, day):
+    """
+    うるう年の暦での通し日（1/1 → 0、2/29 → 59、12/31 → 365）
+    """
+    return date(2000, month, day).timetuple().tm_yday - 1
+
+
+class AnniversaryIndex:
+    """
+    df は有効な顧客の型付きフレーム（日付は datetime64）
+
+    kinds[種別] = (通し日順の行位置, 通し日ごとの開始位置)
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.kinds = {}
+        for kind, col in KINDS.items():
+            dates = df[col]
+            valid = np.flatnonzero(dates.notna().to_numpy())
+            d = dates.iloc[valid]
+            after_feb = (d.dt.month > 2) & ~d.dt.is_leap_year
+            numbers = (d.dt.dayofyear - 1 + after_feb.astype("int64")).to_numpy()
+
+            order = np.argsort(numbers, kind="stable")
+            sorted_numbers = numbers[order]
+            starts = np.searchsorted(sorted_numbers, np.arange(DAYS + 1))
+            self.kinds[kind] = (valid[order], starts)
+
+    def _positions(self, kind, number):
+        positions, starts = self.kinds[kind]
+        return positions[starts[number]:starts[number + 1]]
+
+    def upcoming(self, today, days, kinds=tuple(KINDS)):
+        """
+        today から days 日以内（today を含む）の記念日
+        列：種別・日付・あと何日・年数（何歳 / 何周年）＋ 顧客の列
+        """
+        today = pd.Timestamp(today).date()
+        frames = []
+        for offset in range(days + 1):
+            day = today + timedelta(days=offset)
+            numbers = [day_number(day.month, day.day)]
+            if day.month == 2 and day.day == 28 and not isleap(day.year):
+                numbers.append(FEB29)
+
+            for kind in kinds:
+                positions = np.concatenate([self._positions(kind, n) for n in numbers])
+                if not len(positions):
+                    continue
+                rows = self.df.iloc[positions]
+                years = day.year - rows[KINDS[kind]].dt.year
+                frames.append(rows.assign(種別=kind, 日付=pd.Timestamp(day), あと何日=offset, 年数=years))
+
+        columns = ["種別", "日付", "あと何日", "年数"] + list(self.df.columns)
+        if not frames:
+            return pd.DataFrame(columns=columns)
+
+        result = pd.concat(frames, ignore_index=True)
+        # 初回来店日が今年（0周年）以降の分は記念日ではない
+        result = result[result["年数"] > 0]
+        return result[columns]
@@ -0,0 +1,328 @@
+"""
+CSV / Excel からの一括取り込み
+
+- ファイルは chunksize 行ずつ読む（全体を1つの DataFrame にしない）
+- 1チャンクごとに列を CUSTOMER_COLUMNS / VISIT_COLUMNS に揃えて検証し、
+  ID の無い行にはまとめて ID を払い出し、batch_size 件ずつ mode: "batch" で送る
+- 払い出す ID がファイルで指定済みの ID と重ならないよう、先に ID 列だけ全体を読んでおく
+  （ファイル内で同じ ID が2回以上出てくる行はエラー）
+- チェックポイント（取り込み済みの行数と、送信中チャンクの ID）をファイルに残すので、
+  途中で止まっても同じファイルを選び直せば続きから取り込める
+  送信中だったチャンクは同じ ID で送り直す（ID 指定の上書きなので二重登録にならない）
+"""
+import codecs
+import hashlib
+import io
+import json
+import os
+from datetime import date, datetime
+
+import pandas as pd
+
+from data_store import (
+    CUSTOMER_COLUMNS, CUSTOMER_KEY, DATE_COLUMNS, VISIT_COLUMNS, VISIT_KEY, WEEKDAYS, to_dates,
+)
+
+TABLE_SETTINGS = {
+    "customer": (CUSTOMER_COLUMNS, CUSTOMER_KEY, "customer_only"),
+    "visit": (VISIT_COLUMNS, VISIT_KEY, "visit_only"),
+}
+EXCEL_SUFFIXES = (".xlsx", ".xlsm")
+
+
+# =====================
+# 読み込み
+# =====================
+def _csv_encoding(data):
+    """
+    UTF-8（BOM 付き含む）で読めなければ Excel 既定の Shift_JIS（cp932）とみなす
+    """
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(data[:65536], final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp932"
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _excel_chunks(data, chunksize):
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise ValueError("Excel の取り込みには openpyxl が必要です（pip install openpyxl）") from e
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_cell_text(v) for v in next(rows, ())]
+        chunk = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            chunk.append([_cell_text(v) for v in row[:len(header)]])
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_chunks(data, name, chunksize=500):
+    """
+    CSV / Excel（先頭行が列名）を chunksize 行ずつの文字列 DataFrame で返す
+    """
+    if name.lower().endswith(EXCEL_SUFFIXES):
+        yield from _excel_chunks(data, chunksize)
+        return
+
+    reader = pd.read_csv(
+        io.BytesIO(data), dtype=str, keep_default_na=False, chunksize=chunksize,
+        encoding=_csv_encoding(data), skip_blank_lines=True,
+    )
+    with reader:
+        yield from reader
+
+
+def count_rows(data, name):
+    """
+    進捗表示用のおおよその行数（ヘッダを除く）
+    """
+    if name.lower().endswith(EXCEL_SUFFIXES):
+        try:
+            import openpyxl
+        except ImportError:
+            return None
+        workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    return max(data.count(b"\n") - (0 if data.endswith(b"\n") else -1) - 1, 0)
+
+
+def scan_ids(data, name, table, chunksize=500):
+    """
+    ファイル中で指定済みの ID（空でないもの）と、2回以上出てくる ID を返す
+    """
+    _, key, _ = TABLE_SETTINGS[table]
+    parts = []
+    for chunk in read_chunks(data, name, chunksize):
+        chunk = chunk.rename(columns=lambda c: str(c).strip())
+        if key in chunk.columns:
+            parts.append(chunk[key].astype(str).str.strip())
+    ids = pd.concat(parts, ignore_index=True) if parts else pd.Series([], dtype=str)
+    ids = ids[ids != ""]
+    return ids, set(ids[ids.duplicated()])
+
+
+# =====================
+# 検証・正規化
+# =====================
+def clean_chunk(df, table, known_customers, duplicates=()):
+    """
+    列をテーブルの列に揃えて検証する
+    duplicates … ファイル内で重複している ID（該当する行はすべてエラー）
+    戻り値 (rows, errors)
+        rows   … 取り込める行（全列そろった文字列、ID の無い行は 空文字）
+        errors … 取り込めない行の {"行": 行番号, "理由": ...}
+    df.index はデータ行の通し番号（0 始まり）。行番号は列名の行を1行目として数える（空行は数えない）
+    """
+    columns, key, _ = TABLE_SETTINGS[table]
+    df = df.rename(columns=lambda c: str(c).strip())
+    out = pd.DataFrame(
+        {col: df[col].astype(str).str.strip() if col in df.columns else "" for col in columns},
+        index=df.index,
+    )
+    reasons = pd.Series("", index=df.index)
+
+    def fail(mask, reason):
+        reasons[mask] = reasons[mask] + reason + " "
+
+    for col in DATE_COLUMNS[table]:
+        parsed = to_dates(out[col])
+        fail((out[col] != "") & parsed.isna(), f"{col}が日付ではありません")
+        out[col] = parsed.dt.strftime("%Y-%m-%d").fillna("")
+
+    if table == "customer":
+        fail(out["氏名"] == "", "氏名がありません")
+    else:
+        fail(out["来店日"] == "", "来店日がありません")
+        fail(out["顧客_ID"] == "", "顧客_IDがありません")
+        fail((out["顧客_ID"] != "") & ~out["顧客_ID"].isin(known_customers), "顧客_IDが登録されていません")
+
+        ext = pd.to_numeric(out["延長回数"].replace("", "0"), errors="coerce")
+        fail(ext.isna() | (ext < 0) | (ext % 1 != 0), "延長回数が0以上の整数ではありません")
+        out["延長回数"] = ext.fillna(0).clip(lower=0).astype("int64").astype(str)
+
+        weekday = to_dates(out["来店日"]).dt.dayofweek
+        blank = (out["曜日"] == "") & weekday.notna()
+        out.loc[blank, "曜日"] = weekday[blank].astype(int).map(dict(enumerate(WEEKDAYS)))
+
+    fail(out[key].isin(duplicates), f"{key}がファイル内で重複しています")
+    out["削除"] = (out["削除"] == "1").map({True: "1", False: "0"})
+
+    bad = reasons != ""
+    errors = [
+        {"行": int(pos) + 2, "理由": reason.strip()}
+        for pos, reason in reasons[bad].items()
+    ]
+    return out[~bad], errors
+
+
+# =====================
+# チェックポイント
+# =====================
+class Checkpoint:
+    """
+    done    … 取り込み済みの行数（ファイル先頭から）
+    pending … 送信中のチャンク {"start": 先頭行, "ids": {行番号: 払い出した ID}}
+    """
+
+    def __init__(self, directory, table, data, name):
+        self.digest = hashlib.sha1(data).hexdigest()
+        self.path = os.path.join(directory, f"{table}-{self.digest[:16]}.json")
+        self.name = name
+        self.done = 0
+        self.pending = None
+        self.finished = False
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+            self.done = saved.get("done", 0)
+            self.pending = saved.get("pending")
+            self.finished = saved.get("finished", False)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "name": self.name, "sha1": self.digest, "done": self.done,
+                "pending": self.pending, "finished": self.finished,
+            }, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done, self.pending, self.finished = 0, None, False
+
+
+# =====================
+# 取り込み
+# =====================
+class Importer:
+    """
+    table           … "customer" / "visit"
+    allocator       … id_allocator.IdAllocator（ID の無い行に払い出す）
+    post_batch      … payloads → [(status, message)]（WriteQueue.post_batch）
+    store           … data_store.SheetStore（送れた行を write_rows で手元に反映）
+    known_customers … 来店の 顧客_ID 確認用（取り込んだ顧客は自動で追加）
+    """
+
+    def __init__(self, table, data, name, checkpoint, allocator, post_batch, store,
+                 known_customers=(), chunksize=500, batch_size=100):
+        self.table = table
+        self.data = data
+        self.name = name
+        self.checkpoint = checkpoint
+        self.allocator = allocator
+        self.post_batch = post_batch
+        self.store = store
+        self.known_customers = set(known_customers)
+        self.chunksize = chunksize
+        self.batch_size = batch_size
+        self.imported = 0
+        self.errors = []
+        self.duplicates = set()
+
+    def _assign_ids(self, rows, start):
+        """
+        ID の無い行に払い出す（送信中だったチャンクは前回と同じ ID）
+        """
+        _, key, _ = TABLE_SETTINGS[self.table]
+        pending = self.checkpoint.pending
+        saved = pending["ids"] if pending and pending["start"] == start else {}
+
+        if saved:
+            # 前回払い出した ID はサーバに届いていない分もあるので、その先から払い出す
+            self.allocator.observe(pd.Series(list(saved.values())))
+
+        missing = rows.index[rows[key] == ""]
+        fresh = [pos for pos in missing if str(pos) not in saved]
+        ids = dict(saved)
+        ids.update(zip((str(pos) for pos in fresh), self.allocator.allocate_many(len(fresh))))
+        if len(missing):
+            rows.loc[missing, key] = [ids[str(pos)] for pos in missing]
+
+        self.checkpoint.pending = {"start": start, "ids": {str(pos): ids[str(pos)] for pos in missing}}
+        self.checkpoint.save()
+        return rows
+
+    def _send(self, rows):
+        """
+        batch_size 件ずつ送って、送れた行を手元に反映する
+        """
+        columns, _, mode = TABLE_SETTINGS[self.table]
+        for offset in range(0, len(rows), self.batch_size):
+            part = rows.iloc[offset:offset + self.batch_size]
+            payloads = [dict(record, mode=mode) for record in part[columns].to_dict("records")]
+            outcomes = self.post_batch(payloads)
+
+            ok = [status == "committed" for status, _ in outcomes]
+            sent = part[ok]
+            self.store.write_rows(self.table, sent)
+            self.imported += len(sent)
+            if self.table == "customer":
+                self.known_customers.update(sent[CUSTOMER_KEY])
+
+            for pos, (status, message) in zip(part.index, outcomes):
+                if status != "committed":
+                    self.errors.append({"行": int(pos) + 2, "理由": f"送信に失敗しました {message}".strip()})
+
+    def run(self):
+        """
+        1チャンクごとに (処理済みの行数, 取り込んだ件数, エラー件数) を返す
+        batch 自体の通信エラーは requests.RequestException のまま投げる
+        （チェックポイントが残るので、次回その続きから）
+        """
+        # ファイルで指定済みの ID と重ならないよう、先に全体を見てその先から払い出す
+        explicit, self.duplicates = scan_ids(self.data, self.name, self.table, self.chunksize)
+        self.allocator.observe(explicit)
+
+        start = 0
+        for chunk in read_chunks(self.data, self.name, self.chunksize):
+            end = start + len(chunk)
+            if end <= self.checkpoint.done:
+                start = end
+                continue
+
+            chunk.index = pd.RangeIndex(start, end)
+            chunk = chunk.iloc[max(self.checkpoint.done - start, 0):]
+            rows, errors = clean_chunk(chunk, self.table, self.known_customers, self.duplicates)
+            self.errors.extend(errors)
+
+            rows = self._assign_ids(rows, start)
+            self._send(rows)
+
+            self.checkpoint.done = end
+            self.checkpoint.pending = None
+            self.checkpoint.save()
+            start = end
+            yield end, self.imported, len(self.errors)
+
+        self.checkpoint.finished = True
+        self.checkpoint.save()
@@ -0,0 +1,829 @@
+"""
+顧客・来店データの取得と保持
+
+GAS から取得したシートをプロセス内に保持し、
+2回目以降は差分（?action=get&since=<rev>）だけを取得してマージする。
+画面ごとに必要なテーブルだけ取得する（?action=get&table=customer）。
+"""
+import json
+import os
+import sqlite3
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+from instrumentation import timed
+
+CUSTOMER_COLUMNS = ["氏名","ニックネーム","住所","電話番号",
+                    "生年月日","勤務先・業種","タバコ_銘柄",
+                    "好き","苦手","初回来店日","紹介者_氏名","メモ_顧客","顧客_ID","削除"]
+
+VISIT_COLUMNS = ["来店日","曜日","同伴_氏名","担当_氏名",
+                "延長回数","キープ銘柄","同時来店_氏名","プレゼント_受","プレゼント_渡",
+                "イベント名","メモ_来店","来店履歴_ID","顧客_ID","削除"]
+
+CUSTOMER_KEY = "顧客_ID"
+VISIT_KEY = "来店履歴_ID"
+
+TABLES = ("customer", "visit")
+
+# 版ごとの変更行キーを何版分まで覚えておくか（集計の差分更新用）
+CHANGE_LOG_SIZE = 256
+
+# =====================
+# 正規化
+# =====================
+@timed("normalize_rows")
+def normalize_rows(rows, columns):
+    """
+    GAS の行リスト（列形式からデコード済みの DataFrame も可）→ DataFrame
+    空でも列を保証し、削除列を "0" / "1" に揃える
+    """
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows or [])
+
+    # --- 空でも列を保証 ---
+    if df.empty:
+        df = pd.DataFrame(columns=columns)
+
+    # ---  削除列を保証 ---
+    if "削除" not in df.columns:
+        df["削除"] = ""
+
+    # --- 削除列を正規化 ---
+    df["削除"] = np.where(df["削除"].astype(str).str.strip() == "1", "1", "0")
+
+    return df
+
+# =====================
+# 型付きフレーム（画面用）
+# =====================
+DATE_COLUMNS = {
+    "customer": ["生年月日", "初回来店日"],
+    "visit": ["来店日"],
+}
+
+WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+
+# 時刻にタイムゾーンが付いた値（GAS の日付セルは "2024-05-01T15:00:00.000Z" で届く）
+TZ_SUFFIX = r"\d{2}:\d{2}.*(?:Z|[+-]\d{2}:?\d{2})$"
+LOCAL_TZ = datetime.now().astimezone().tzinfo
+
+def to_dates(s):
+    """
+    文字列の日付列 → datetime64（日付のみ・タイムゾーンなし、不正値は NaT）
+    タイムゾーン付きの値はローカル時刻に直してから日付にする（付いていない値と混在してもよい）
+    """
+    text = s.fillna("").astype(str).str.strip()
+    aware = text.str.contains(TZ_SUFFIX)
+    out = pd.to_datetime(text.where(~aware & (text != "")), errors="coerce", format="mixed")
+    if aware.any():
+        local = pd.to_datetime(text[aware], errors="coerce", format="mixed", utc=True)
+        out[aware] = local.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+    return out.dt.normalize()
+
+@timed("typed_frame")
+def typed_frame(df, table):
+    """
+    GAS の文字列フレーム → 画面用の型付きフレーム（データ版ごとに1回だけ作る）
+
+    - 日付列 … datetime64
+    - 延長回数 … Int16
+    - 曜日 / 削除 … category
+    - その他 … 文字列（欠損は ""）
+    """
+    df = df.copy()
+    date_cols = [c for c in DATE_COLUMNS[table] if c in df.columns]
+
+    for col in date_cols:
+        df[col] = to_dates(df[col])
+
+    if "延長回数" in df.columns:
+        df["延長回数"] = pd.to_numeric(df["延長回数"], errors="coerce").astype("Int16")
+    if "曜日" in df.columns:
+        # 曜日以外の値（空など）は先に欠損にしておく
+        df["曜日"] = pd.Categorical(df["曜日"].where(df["曜日"].isin(WEEKDAYS)), categories=WEEKDAYS)
+    df["削除"] = pd.Categorical(df["削除"], categories=["0", "1"])
+
+    typed = set(date_cols) | {"延長回数", "曜日", "削除"}
+    text_cols = [c for c in df.columns if c not in typed]
+    df[text_cols] = df[text_cols].fillna("")
+
+    return df
+
+@timed("merge_rows")
+def merge_rows(base, changed, key):
+    """
+    base に changed を上書きマージ（key が同じ行は changed 側を採用）
+    既存行はその場で更新し、新しい行は末尾に追加する
+    """
+    if changed.empty:
+        return base
+    if base.empty:
+        return changed.reset_index(drop=True)
+
+    changed = changed.drop_duplicates(key, keep="last")
+    base_keys = base[key].astype(str)
+    changed_keys = changed[key].astype(str)
+
+    merged = base.copy()
+    for col in changed.columns:
+        if col not in merged.columns:
+            merged[col] = None
+
+    hit = changed_keys.isin(base_keys).to_numpy()
+    if hit.any():
+        pos = pd.Series(range(len(base)), index=base_keys.to_numpy())
+        pos = pos[~pos.index.duplicated(keep="last")]
+        rows = pos.loc[changed_keys[hit].to_numpy()].to_numpy()
+        cols = [merged.columns.get_loc(c) for c in changed.columns]
+        for col, loc in zip(changed.columns, cols):
+            values = merged.iloc[:, loc].astype(object).to_numpy(copy=True)
+            values[rows] = changed[col].to_numpy()[hit]
+            merged[col] = values
+
+    if (~hit).any():
+        merged = pd.concat([merged, changed[~hit]], ignore_index=True)
+
+    return merged
+
+# =====================
+# 書き込みモード → (テーブル, 削除フラグ)
+# =====================
+WRITE_MODES = {
+    "customer_only": ("customer", None),
+    "customer_delete": ("customer", "1"),
+    "customer_restore": ("customer", "0"),
+    "visit_only": ("visit", None),
+    "visit_delete": ("visit", "1"),
+    "visit_restore": ("visit", "0"),
+}
+
+# =====================
+# ディスク上のスナップショット（SQLite）
+# =====================
+def _serialized(method):
+    """
+    接続は1本をスレッド間で共有するので、Snapshot の操作は1つずつ実行する
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class Snapshot:
+    """
+    customer / visit を SQLite に保存して、次のプロセス起動時に即表示する
+
+    テーブル定義は CUSTOMER_COLUMNS / VISIT_COLUMNS から作る（全列 TEXT）
+    meta テーブルにテーブルごとの最後に取り込んだ rev と、接続先 GAS・列構成を持つ
+    （接続先か列構成が前回と違えば、開いた時点で中身を捨てて作り直す）
+    <table>_archive … 古い削除済み行の退避先（普段は読み込まない）
+    deleted_at      … 削除済みの行を最初に見た時刻（アーカイブまでの経過の起点）
+    """
+
+    SCHEMA = {
+        "customer": (CUSTOMER_COLUMNS, CUSTOMER_KEY),
+        "visit": (VISIT_COLUMNS, VISIT_KEY),
+    }
+
+    def __init__(self, path, backend=None):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._create()
+        self._check_source(backend)
+
+    def _check_source(self, backend):
+        """
+        別の GAS・別の列構成で保存したスナップショットなら捨てる
+        """
+        source = {
+            "backend": "" if backend is None else str(backend),
+            "columns": json.dumps({t: c for t, (c, _) in self.SCHEMA.items()}, ensure_ascii=False),
+        }
+        saved = dict(self._conn.execute(
+            'SELECT "name", "value" FROM "meta" WHERE "name" IN (\'backend\', \'columns\')'
+        ).fetchall())
+        if saved == source:
+            return
+
+        with self._conn:
+            names = self._conn.execute('SELECT "name" FROM "sqlite_master" WHERE "type" = \'table\'').fetchall()
+            for (name,) in names:
+                self._conn.execute(f'DROP TABLE "{name}"')
+        self._create()
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO "meta" VALUES (?, ?)', source.items())
+
+    def _create(self):
+        with self._conn:
+            for table, (columns, key) in self.SCHEMA.items():
+                cols = ", ".join(
+                    f'"{c}" TEXT PRIMARY KEY' if c == key else f'"{c}" TEXT' for c in columns
+                )
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({cols})')
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}_archive" ({cols})')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS "meta" ("name" TEXT PRIMARY KEY, "value" TEXT)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS "deleted_at" '
+                '("table" TEXT, "key" TEXT, "at" REAL, PRIMARY KEY ("table", "key"))'
+            )
+
+    @_serialized
+    def load(self):
+        """
+        保存済みなら (revs, customer_df, visit_df)、まだ無ければ None
+        revs … {テーブル名: rev}（まだ一度も取り込んでいないテーブルは含まない）
+        """
+        row = self._conn.execute('SELECT "value" FROM "meta" WHERE "name" = \'saved_at\'').fetchone()
+        if row is None:
+            return None
+
+        frames = {}
+        for table, (columns, _) in self.SCHEMA.items():
+            df = pd.read_sql_query(f'SELECT * FROM "{table}"', self._conn)
+            frames[table] = normalize_rows(df, columns)
+
+        revs = {}
+        for table in self.SCHEMA:
+            rev = self._conn.execute('SELECT "value" FROM "meta" WHERE "name" = ?', (f"rev_{table}",)).fetchone()
+            if rev is None:
+                # 旧形式（全テーブル共通の rev）
+                rev = self._conn.execute('SELECT "value" FROM "meta" WHERE "name" = \'rev\'').fetchone()
+            if rev is not None:
+                revs[table] = int(rev[0]) if rev[0] is not None else None
+        return revs, frames["customer"], frames["visit"]
+
+    def _schema(self, table):
+        return self.SCHEMA[table.removesuffix("_archive")]
+
+    def _records(self, table, df):
+        columns, _ = self._schema(table)
+        df = df.reindex(columns=columns)
+        df = df.astype(object).where(df.notna(), None)
+        return [
+            tuple(None if v is None else str(v) for v in row)
+            for row in df.itertuples(index=False, name=None)
+        ]
+
+    def _insert(self, table, df):
+        # トランザクションは呼び出し側で張る
+        columns, _ = self._schema(table)
+        cols = ", ".join(f'"{c}"' for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        self._conn.executemany(
+            f'INSERT OR REPLACE INTO "{table}" ({cols}) VALUES ({marks})',
+            self._records(table, df)
+        )
+
+    @_serialized
+    def upsert(self, table, df):
+        """
+        変更行だけ書き込む（key が同じ行は置き換え）
+        """
+        if df.empty:
+            return
+        with self._conn:
+            self._insert(table, df)
+            self._touch()
+
+    @_serialized
+    def replace(self, table, df, rev):
+        """
+        全行を置き換えて rev を記録する（途中で落ちても前の中身と rev のまま）
+        """
+        with self._conn:
+            self._conn.execute(f'DELETE FROM "{table}"')
+            self._insert(table, df)
+            self._write_rev(table, rev)
+            self._touch()
+
+    # =====================
+    # アーカイブ（古い削除済み行）
+    # =====================
+    @_serialized
+    def archive(self, table, df):
+        """
+        df の行を <table>_archive へ移す
+        """
+        if df.empty:
+            return
+        _, key = self.SCHEMA[table]
+        with self._conn:
+            self._insert(f"{table}_archive", df)
+            self._conn.executemany(
+                f'DELETE FROM "{table}" WHERE "{key}" = ?',
+                [(str(k),) for k in df[key]]
+            )
+
+    @_serialized
+    def unarchive(self, table, keys):
+        """
+        keys の行をアーカイブから取り出して返す（アーカイブからは消す）
+        """
+        columns, key = self.SCHEMA[table]
+        keys = [str(k) for k in keys]
+        if not keys:
+            return normalize_rows([], columns)
+
+        found = []
+        with self._conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ", ".join("?" for _ in chunk)
+                where = f'WHERE "{key}" IN ({marks})'
+                found.append(pd.read_sql_query(f'SELECT * FROM "{table}_archive" {where}', self._conn, params=chunk))
+                self._conn.execute(f'DELETE FROM "{table}_archive" {where}', chunk)
+
+        return normalize_rows(pd.concat(found, ignore_index=True), columns)
+
+    @_serialized
+    def archived_keys(self, table):
+        """
+        アーカイブ済みの行のキーだけ（ID 払い出しで既存の番号を避ける用）
+        """
+        _, key = self.SCHEMA[table]
+        rows = self._conn.execute(f'SELECT "{key}" FROM "{table}_archive"').fetchall()
+        return pd.Series([r[0] for r in rows], dtype=object, name=key)
+
+    @_serialized
+    def load_archive(self, table):
+        columns, _ = self.SCHEMA[table]
+        df = pd.read_sql_query(f'SELECT * FROM "{table}_archive"', self._conn)
+        return normalize_rows(df, columns)
+
+    @_serialized
+    def clear_archive(self, table):
+        with self._conn:
+            self._conn.execute(f'DELETE FROM "{table}_archive"')
+
+    @_serialized
+    def load_deleted_at(self, table):
+        """
+        キー → 削除済みの行を最初に見た時刻（time.time()）
+        """
+        rows = self._conn.execute('SELECT "key", "at" FROM "deleted_at" WHERE "table" = ?', (table,))
+        return dict(rows.fetchall())
+
+    @_serialized
+    def set_deleted_at(self, table, stamps):
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO "deleted_at" VALUES (?, ?, ?)',
+                [(table, key, at) for key, at in stamps.items()]
+            )
+
+    @_serialized
+    def drop_deleted_at(self, table, keys):
+        with self._conn:
+            self._conn.executemany(
+                'DELETE FROM "deleted_at" WHERE "table" = ? AND "key" = ?',
+                [(table, key) for key in keys]
+            )
+
+    @_serialized
+    def set_rev(self, table, rev):
+        with self._conn:
+            self._write_rev(table, rev)
+            self._touch()
+
+    def _write_rev(self, table, rev):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO "meta" VALUES (?, ?)',
+            (f"rev_{table}", None if rev is None else str(rev))
+        )
+
+    def _touch(self):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO "meta" VALUES (\'saved_at\', ?)', (str(time.time()),)
+        )
+
+# =====================
+# シートストア
+# =====================
+class SheetStore:
+    """
+    customer / visit シートのプロセス内コピー
+
+    client   … gas_client.GasClient
+
+    revs     … テーブルごとの最後に取り込んだサーバ側リビジョン
+               None のときは次回フル取得
+    versions … テーブルごとの版数（中身が変わった時だけ増える）
+               各セッションは表示中の版と current_versions() を比べて更新を知る
+    changes  … テーブルごとの (版数, 変わった行のキー) の履歴（changes_since 用）
+    max_age  … この秒数を過ぎたら他端末の更新を拾うため再同期する
+    snapshot … Snapshot を渡すと起動時にディスクから復元し、
+               GAS からの更新はバックグラウンドで差分取得する
+    archive_after_days … snapshot があるとき、削除されてからこの日数が過ぎた行を
+               snapshot のアーカイブへ移し、普段のフレームから外す
+    """
+
+    def __init__(self, client, max_age=60, snapshot=None, archive_after_days=None):
+        self.client = client
+        self.max_age = max_age
+        self.revs = {name: None for name in TABLES}
+        self.customer_df = normalize_rows([], CUSTOMER_COLUMNS)
+        self.visit_df = normalize_rows([], VISIT_COLUMNS)
+        self.versions = {name: 0 for name in TABLES}
+        self.archive_versions = {name: 0 for name in TABLES}
+        self.changes = {name: deque(maxlen=CHANGE_LOG_SIZE) for name in TABLES}
+        self.archive_after_days = archive_after_days
+        self._dirty = {name: True for name in TABLES}
+        self._synced_at = {name: 0.0 for name in TABLES}
+        self._loaded = {name: False for name in TABLES}
+        self._inflight = None
+        self._key_columns = {}
+        self._deleted_at = {}
+        self._lock = threading.Lock()
+        self.snapshot = snapshot
+
+        if snapshot is not None:
+            self._restore()
+
+    def _restore(self):
+        """
+        スナップショットから即復元 → GAS との差分はバックグラウンドで取る
+        """
+        try:
+            saved = self.snapshot.load()
+        except (sqlite3.Error, ValueError):
+            saved = None
+        if saved is None:
+            return
+
+        revs, customer, visit = saved
+        self._replace("customer", customer)
+        self._replace("visit", visit)
+        # 保存されていないテーブル（その画面を開く前だった）は初回アクセス時に取得
+        restored = [name for name in TABLES if name in revs]
+        for name in restored:
+            self.revs[name] = revs[name]
+            self._dirty[name] = False
+            self._synced_at[name] = time.monotonic()
+            self._loaded[name] = True
+        if restored:
+            self.reconcile_async(restored)
+
+    def fetch(self, since=None, table=None):
+        return self.client.get(since=since, table=table)
+
+    def apply(self, data, since=None, tables=TABLES):
+        """
+        GAS のレスポンスを tables の分だけ取り込む
+        （table 指定を無視する GAS が他のテーブルを返しても、since が合わないので使わない）
+
+        - rev が無い（差分非対応の GAS）/ full=true / since 未指定 → 全置換
+        - それ以外 → 変更行だけマージ
+        中身が変わったテーブルだけ版数を上げる
+
+        正規化・マージ・スナップショットの書き込みはロックの外で行い、
+        ロックの中ではフレームと版数の差し替えだけ行う（その間も frames() は今の版を返せる）
+        """
+        is_delta = since is not None and "rev" in data and not data.get("full")
+        rev = data.get("rev")
+        with self._lock:
+            bases = {table: getattr(self, f"{table}_df") for table in tables}
+
+        prepared = []
+        for table in tables:
+            key = CUSTOMER_KEY if table == "customer" else VISIT_KEY
+            columns = CUSTOMER_COLUMNS if table == "customer" else VISIT_COLUMNS
+            changed = normalize_rows(data.get(table), columns)
+            archive_changed = False
+
+            if self.snapshot is not None:
+                if is_delta:
+                    # ★ アーカイブ済みの行が更新されたら通常側に戻す
+                    archive_changed = not self.snapshot.unarchive(table, changed[key]).empty
+                    self.snapshot.upsert(table, changed)
+                    self.snapshot.set_rev(table, rev)
+                else:
+                    # ★ サーバ側でも削除のままの行はアーカイブに残す（それ以外は通常側に戻す）
+                    archived = self.snapshot.archived_keys(table).astype(str)
+                    kept = changed[key].astype(str).isin(archived).to_numpy() & (changed["削除"] == "1").to_numpy()
+                    self.snapshot.clear_archive(table)
+                    self.snapshot.upsert(f"{table}_archive", changed[kept])
+                    archive_changed = True
+                    changed = changed[~kept].reset_index(drop=True)
+                    self.snapshot.replace(table, changed, rev)
+
+            keys = None
+            df = changed
+            if is_delta:
+                keys = changed[key]
+                df = merge_rows(bases[table], changed, key)
+            prepared.append((table, key, changed, df, keys, archive_changed, not df.equals(bases[table])))
+
+        with self._lock:
+            for table, key, changed, df, keys, archive_changed, differs in prepared:
+                current = getattr(self, f"{table}_df")
+                if current is not bases[table]:
+                    # 取り込み中に書き込みが入ったら、その上にマージし直す
+                    if is_delta:
+                        df = merge_rows(current, changed, key)
+                    self._replace(table, df, keys)
+                elif differs:
+                    self._set_frame(table, df, keys)
+                self.revs[table] = rev
+                if archive_changed:
+                    self.archive_versions[table] += 1
+
+        self._compact(tables)
+
+    def _deletion_stamps(self, table):
+        if table not in self._deleted_at:
+            self._deleted_at[table] = self.snapshot.load_deleted_at(table)
+        return self._deleted_at[table]
+
+    def _compact(self, tables=TABLES):
+        """
+        削除されてから保持期間を過ぎた行をアーカイブへ移す
+        削除された時刻は、削除済みの行を最初に見た時刻（deleted_at）で数える
+        （来店日・初回来店日が古くても、削除した直後の行は移さない）
+        """
+        if self.snapshot is None or self.archive_after_days is None:
+            return
+
+        now = time.time()
+        cutoff = now - self.archive_after_days * 86400
+        with self._lock:
+            frames = {table: getattr(self, f"{table}_df") for table in tables}
+
+        for table in tables:
+            key = CUSTOMER_KEY if table == "customer" else VISIT_KEY
+            df = frames[table]
+            deleted = set(df.loc[(df["削除"] == "1").to_numpy(), key].astype(str))
+            stamps = self._deletion_stamps(table)
+
+            # --- 新しく削除された行は今を記録、復元された / 消えた行は記録を消す ---
+            seen = {k: now for k in deleted - stamps.keys()}
+            gone = [k for k in stamps if k not in deleted]
+            if seen:
+                self.snapshot.set_deleted_at(table, seen)
+                stamps.update(seen)
+            if gone:
+                self.snapshot.drop_deleted_at(table, gone)
+                for k in gone:
+                    del stamps[k]
+
+            expired = [k for k, at in stamps.items() if at < cutoff]
+            if not expired:
+                continue
+
+            old = df[df[key].astype(str).isin(expired).to_numpy()]
+            self.snapshot.archive(table, old)
+            self.snapshot.drop_deleted_at(table, expired)
+            for k in expired:
+                del stamps[k]
+
+            with self._lock:
+                current = getattr(self, f"{table}_df")
+                # 読んでから差し替えまでに復元された行は残す
+                moved = current[key].astype(str).isin(expired).to_numpy() & (current["削除"] == "1").to_numpy()
+                self._replace(table, current[~moved].reset_index(drop=True), old[key])
+                self.archive_versions[table] += 1
+
+    def archived(self, table):
+        """
+        アーカイブ済みの行と版数（削除データ一覧を開いた時だけ読む）
+        """
+        columns = CUSTOMER_COLUMNS if table == "customer" else VISIT_COLUMNS
+        with self._lock:
+            version = self.archive_versions[table]
+        if self.snapshot is None:
+            return normalize_rows([], columns), version
+        return self.snapshot.load_archive(table), version
+
+    def archive_version(self, table):
+        with self._lock:
+            return self.archive_versions[table]
+
+    def _replace(self, table, df, keys=None):
+        """
+        中身が変わった時だけ差し替えて版数を上げる
+        keys … 変わった行のキー（None は全体が変わった扱い）→ changes に記録
+        """
+        if not df.equals(getattr(self, f"{table}_df")):
+            self._set_frame(table, df, keys)
+
+    def _set_frame(self, table, df, keys=None):
+        """
+        差し替えて版数を上げる（中身が変わったことは呼び出し側で確認済み）
+        """
+        setattr(self, f"{table}_df", df)
+        self.versions[table] += 1
+        self.changes[table].append(
+            (self.versions[table], None if keys is None else frozenset(str(k) for k in keys))
+        )
+
+    def changes_since(self, table, since_version, version):
+        """
+        since_version より後 〜 version までに変わった行のキー
+        記録が残っていない / 全置換を挟んだ場合は None（作り直しが必要）
+        """
+        with self._lock:
+            entries = [(v, keys) for v, keys in self.changes[table] if since_version < v <= version]
+        if len(entries) != version - since_version or any(keys is None for _, keys in entries):
+            return None
+        return frozenset().union(*(keys for _, keys in entries))
+
+    def is_stale(self, table):
+        return self._dirty[table] or time.monotonic() - self._synced_at[table] > self.max_age
+
+    def sync(self, force=False, tables=TABLES, wait=False):
+        """
+        tables のうち、無効化された / max_age 経過 のテーブルを差分同期する
+
+        - GAS からの取得はプロセスで同時に1本だけ（後から来た呼び出しはその結果を使う）
+        - 読み込み済みのテーブルは手元の版のまま返し、裏で取り直す（wait=True なら待つ）
+        - まだ読み込んでいないテーブルがあれば取得が終わるまで待つ
+        """
+        if force:
+            with self._lock:
+                for t in tables:
+                    self._dirty[t] = True
+
+        while True:
+            with self._lock:
+                stale = [t for t in tables if self.is_stale(t)]
+                if not stale:
+                    return
+                must_wait = wait or not all(self._loaded[t] for t in stale)
+                flight = self._inflight
+                leader = flight is None
+                if leader:
+                    flight = self._inflight = Future()
+                    # 取得中に無効化されたら、もう一度取り直す
+                    for t in stale:
+                        self._dirty[t] = False
+
+            if leader:
+                if must_wait:
+                    self._refresh(stale, flight)
+                else:
+                    threading.Thread(target=self._refresh, args=(stale, flight), daemon=True).start()
+
+            if not must_wait:
+                return
+            flight.result()
+
+    def _refresh(self, stale, flight):
+        """
+        stale を GAS から取得して取り込む（結果は flight で待っている側に渡す）
+        1テーブルだけなら ?table= で絞って取得
+        差分取得に失敗したらフル取得にフォールバック
+        """
+        error = None
+        try:
+            with self._lock:
+                revs = [self.revs[t] for t in stale]
+            since = None if None in revs else min(revs)
+            table = stale[0] if len(stale) == 1 else None
+            try:
+                data = self.fetch(since, table)
+                self.apply(data, since, stale)
+            except (requests.RequestException, ValueError):
+                if since is None:
+                    raise
+                # ★ 差分が取れなければフル再同期
+                data = self.fetch(None, table)
+                self.apply(data, None, stale)
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            now = time.monotonic()
+            for t in stale:
+                if error is None:
+                    self._synced_at[t] = now
+                    self._loaded[t] = True
+                else:
+                    self._dirty[t] = True
+            self._inflight = None
+
+        if error is None:
+            flight.set_result(None)
+        else:
+            flight.set_exception(error)
+
+    def frames(self, tables=TABLES):
+        """
+        tables を必要なら同期して (customer_df, visit_df, versions) を返す
+        読み込み済みのテーブルは古くても待たずに返す（最新は裏で取得）
+        versions はこのフレームに対応する版数（派生データのキャッシュキー用）
+        フレームは差し替え式で更新するので、そのまま読み取り専用で使える
+        """
+        self.sync(tables=tables)
+        with self._lock:
+            return self.customer_df, self.visit_df, dict(self.versions)
+
+    def current_versions(self):
+        with self._lock:
+            return dict(self.versions)
+
+    def key_column(self, table):
+        """
+        (ID 列, 版数) を同時に取る（ID 払い出し用）
+        アーカイブ済みの行の ID も含める（普段のフレームに無くても番号は使用済み）
+        版数は (通常側, アーカイブ) の組
+        """
+        key = CUSTOMER_KEY if table == "customer" else VISIT_KEY
+        with self._lock:
+            version = (self.versions[table], self.archive_versions[table])
+            cached = self._key_columns.get(table)
+            if cached is not None and cached[0] == version:
+                return cached[1], version
+            ids = getattr(self, f"{table}_df")[key]
+
+        # SQLite はロックの外で読む（途中でアーカイブが変わっても版数がずれるので次回読み直す）
+        if self.snapshot is not None:
+            ids = pd.concat([ids, self.snapshot.archived_keys(table)], ignore_index=True)
+        with self._lock:
+            self._key_columns[table] = (version, ids)
+        return ids, version
+
+    def write_through(self, payload):
+        """
+        書き込みキューに積んだ payload をローカルのフレームに即反映する（再取得しない）
+        サーバ側の最終状態には送信後の reconcile_async で合わせる
+        """
+        payload = dict(payload)
+        table, flag = WRITE_MODES[payload.pop("mode")]
+        key = CUSTOMER_KEY if table == "customer" else VISIT_KEY
+        columns = CUSTOMER_COLUMNS if table == "customer" else VISIT_COLUMNS
+
+        row = payload
+        unarchived = False
+        if flag is not None:
+            with self._lock:
+                current = getattr(self, f"{table}_df")
+            match = current[current[key].astype(str) == str(payload[key])]
+            if match.empty and self.snapshot is not None:
+                # ★ アーカイブ済みの行の復元
+                match = self.snapshot.unarchive(table, [payload[key]])
+                unarchived = not match.empty
+            row = match.iloc[0].to_dict() if not match.empty else {key: payload[key]}
+            row["削除"] = flag
+
+        row = normalize_rows([row], columns)
+        with self._lock:
+            merged = merge_rows(getattr(self, f"{table}_df"), row, key)
+            self._replace(table, merged, [payload[key]])
+            if unarchived:
+                self.archive_versions[table] += 1
+
+        # スナップショットへの書き込みはロックの外で
+        if self.snapshot is not None:
+            self.snapshot.upsert(table, merged[merged[key].astype(str) == str(payload[key])])
+
+    def write_rows(self, table, rows):
+        """
+        まとめて POST 済みの行（取り込みなど）を1回のマージで反映する
+        rows … 全列そろった行の DataFrame / 行リスト
+        """
+        key = CUSTOMER_KEY if table == "customer" else VISIT_KEY
+        columns = CUSTOMER_COLUMNS if table == "customer" else VISIT_COLUMNS
+        df = normalize_rows(rows, columns)
+        if df.empty:
+            return
+
+        with self._lock:
+            self._replace(table, merge_rows(getattr(self, f"{table}_df"), df, key), df[key])
+        if self.snapshot is not None:
+            self.snapshot.upsert(table, df)
+
+    def reconcile_async(self, tables=TABLES):
+        """
+        バックグラウンドで tables を差分同期し、サーバ側の最終状態に合わせる
+        """
+        thread = threading.Thread(target=self._reconcile, args=(tuple(tables),), daemon=True)
+        thread.start()
+        return thread
+
+    def _reconcile(self, tables):
+        try:
+            self.sync(force=True, tables=tables, wait=True)
+        except (requests.RequestException, ValueError):
+            # 失敗しても次回の max_age 経過時に取り直す
+            with self._lock:
+                for table in tables:
+                    self._synced_at[table] = 0.0
+
+    def reset(self):
+        """
+        次回の sync をフル取得にする
+        """
+        with self._lock:
+            self.revs = {name: None for name in TABLES}
+            self._dirty = {name: True for name in TABLES}
@@ -0,0 +1,142 @@
+"""
+GAS（Apps Script Web アプリ）との通信
+
+- requests.Session で接続を使い回す（googleusercontent へのリダイレクト先も keep-alive）
+- すべての呼び出しに (接続, 読み込み) タイムアウト
+- 429 / 5xx はバックオフ付きで再試行（書き込みは ID 指定の上書きなので再送しても安全）
+- mode ごとのレイテンシを instrumentation に gas.<mode> で記録
+- 取得は列形式（?format=columnar）を要求し、旧形式（行ごとの dict）が返ってきてもそのまま使う
+
+列形式のテーブル:
+    {"columns": [列名...], "values": [[列の値...], ...],
+     "dictionaries": {列名: [値...]}}   ← dictionaries にある列の values は値リストの番号（-1 は空）
+レスポンス全体を gzip して base64 にした {"encoding": "gzip+base64", "payload": "..."} でもよい
+"""
+import base64
+import gzip
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+TABLE_NAMES = ("customer", "visit")
+
+
+# =====================
+# 列形式のデコード
+# =====================
+def unpack(data):
+    """
+    gzip+base64 で包まれたレスポンスを開く（包まれていなければそのまま）
+    """
+    if isinstance(data, dict) and data.get("encoding") == "gzip+base64":
+        return json.loads(gzip.decompress(base64.b64decode(data["payload"])))
+    return data
+
+
+def columnar_frame(table):
+    """
+    列形式のテーブル → DataFrame（行ごとの dict を経由しない）
+    """
+    columns = table["columns"]
+    values = table["values"]
+    dictionaries = table.get("dictionaries") or {}
+    if len(values) != len(columns):
+        raise ValueError("columnar table: columns and values differ in length")
+
+    data = {}
+    for col, col_values in zip(columns, values):
+        if col in dictionaries:
+            # 末尾に None を足して、-1（空）も同じ添字で引けるようにする
+            lookup = np.asarray(list(dictionaries[col]) + [None], dtype=object)
+            data[col] = lookup[np.asarray(col_values, dtype=np.int64)]
+        else:
+            data[col] = np.asarray(col_values, dtype=object)
+    return pd.DataFrame(data, columns=columns)
+
+
+def decode_tables(data):
+    """
+    レスポンス中の列形式テーブルを DataFrame に置き換える（旧形式の行リストはそのまま）
+    """
+    data = unpack(data)
+    if not isinstance(data, dict):
+        raise ValueError("unexpected GAS response")
+    return {
+        key: columnar_frame(value) if key in TABLE_NAMES and isinstance(value, dict) else value
+        for key, value in data.items()
+    }
+
+
+class GasClient:
+    """
+    GAS_BASE_URL に対する GET（?action=get）/ POST（mode 付き JSON）
+    """
+
+    def __init__(self, base_url, timeout=(5, 30), retries=3, backoff=0.5, pool_size=10, columnar=True):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.columnar = columnar
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _call(self, mode, method, **kwargs):
+        start = time.perf_counter()
+        ok = False
+        try:
+            res = self.session.request(method, self.base_url, timeout=self.timeout, **kwargs)
+            res.raise_for_status()
+            ok = True
+            return res
+        finally:
+            instrumentation.record(f"gas.{mode}", time.perf_counter() - start, ok)
+
+    def get(self, since=None, table=None):
+        """
+        ?action=get（since 指定時は差分、table 指定時はそのテーブルだけ）
+        列形式で返ってきたテーブルは DataFrame、旧形式なら行リストのまま
+        """
+        params = {"action": "get"}
+        if self.columnar:
+            params["format"] = "columnar"
+        if since is not None:
+            params["since"] = since
+        if table is not None:
+            params["table"] = table
+        mode = "get" if since is None else "get_since"
+        if table is not None:
+            mode = f"{mode}:{table}"
+        res = self._call(mode, "GET", params=params)
+        with instrumentation.timed("gas.decode"):
+            return decode_tables(res.json())
+
+    def post(self, payload):
+        """
+        書き込み。JSON で返ってこない GAS もあるので、その場合は {} を返す
+        """
+        res = self._call(payload.get("mode", "post"), "POST", json=payload)
+        try:
+            data = res.json()
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
@@ -0,0 +1,111 @@
+"""
+顧客_ID / 来店履歴_ID の払い出し
+
+- 既存 ID の最大値はデータ版が変わった時だけ計算し、あとはカウンタを進めるだけ
+- ロックで同一プロセス内のセッション同士の重複を防ぐ
+- reserve を渡すと GAS からまとめて番号を予約する（別プロセス・別端末とも重複しない）
+"""
+import threading
+
+import pandas as pd
+import requests
+
+
+class IdAllocator:
+    """
+    prefix  … "C" / "V"
+    reserve … reserve(count) → 予約した先頭番号（非対応なら None）
+    """
+
+    def __init__(self, prefix, width=5, reserve=None, block=20):
+        self.prefix = prefix
+        self.width = width
+        self.reserve = reserve
+        self.block = block
+        self._next = 1
+        self._cursor = 0
+        self._block_end = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def format(self, num):
+        return f"{self.prefix}{num:0{self.width}d}"
+
+    def observe(self, ids, version=None):
+        """
+        既存 ID の最大値を取り込む（同じ version なら何もしない）
+        """
+        if version is not None and version == self._version:
+            return
+
+        ids = ids.astype(str)
+        nums = ids[ids.str.startswith(self.prefix)].str.slice(len(self.prefix))
+        top = pd.to_numeric(nums, errors="coerce").max()
+
+        with self._lock:
+            if pd.notna(top):
+                self._next = max(self._next, int(top) + 1)
+            self._version = version
+
+    def _reserve_block(self, size=None):
+        """
+        予約ブロックを取り直す
+        非対応の GAS なら以後ローカル採番、通信エラーなら今回だけローカル採番
+        """
+        size = max(size or 0, self.block)
+        try:
+            start = self.reserve(size)
+        except requests.RequestException:
+            return False
+
+        if start is None:
+            self.reserve = None
+            return False
+
+        self._cursor, self._block_end = int(start), int(start) + size
+        return True
+
+    def allocate(self):
+        with self._lock:
+            if self.reserve is not None:
+                if self._cursor < self._block_end or self._reserve_block():
+                    num = self._cursor
+                    self._cursor += 1
+                    return self.format(num)
+
+            num = self._next
+            self._next += 1
+            return self.format(num)
+
+    def allocate_many(self, count):
+        """
+        count 個まとめて払い出す（足りない分の予約は1回で取る）
+        """
+        with self._lock:
+            nums = []
+            if self.reserve is not None:
+                take = min(count, self._block_end - self._cursor)
+                nums.extend(range(self._cursor, self._cursor + take))
+                self._cursor += take
+                need = count - take
+                if need and self._reserve_block(need):
+                    nums.extend(range(self._cursor, self._cursor + need))
+                    self._cursor += need
+
+            need = count - len(nums)
+            nums.extend(range(self._next, self._next + need))
+            self._next += need
+            return [self.format(num) for num in nums]
+
+
+def gas_reserver(client, table):
+    """
+    mode: "reserve_ids" で番号ブロックを予約する reserve 関数
+    """
+    def reserve(count):
+        res = client.post({"mode": "reserve_ids", "table": table, "count": count})
+        if res.get("status") != "ok" or "start" not in res:
+            return None
+        return res["start"]
+
+    return reserve
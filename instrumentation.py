@@ -0,0 +1,192 @@
+"""
+処理時間の計測
+
+- timed("名前") … with でも デコレータ でも使えるタイマー
+- 計測値はプロセス全体で (メニュー, 名前) ごとに 回数 / 合計秒 / 最大秒 / エラー数 を集計
+- メニューは start_rerun で再実行ごとに設定（バックグラウンドのスレッドは "background"）
+- 再実行ごとの内訳は RerunTimings に残す（デバッグ表示・ログ用）
+- prometheus_text / start_exporter で Prometheus のテキスト形式に書き出す
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("perf")
+
+BACKGROUND = "background"
+
+_scope = contextvars.ContextVar("perf_scope", default=BACKGROUND)
+_rerun = contextvars.ContextVar("perf_rerun", default=None)
+
+
+class Registry:
+    """
+    (scope, name) → {count, total, max, errors}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, scope, name, seconds, ok=True):
+        with self._lock:
+            stat = self._stats.setdefault((scope, name), {"count": 0, "total": 0.0, "max": 0.0, "errors": 0})
+            stat["count"] += 1
+            stat["total"] += seconds
+            stat["max"] = max(stat["max"], seconds)
+            if not ok:
+                stat["errors"] += 1
+
+    def snapshot(self):
+        """
+        {(scope, name): {count, total, max, errors, avg}} のコピー
+        """
+        with self._lock:
+            return {
+                key: dict(stat, avg=stat["total"] / stat["count"] if stat["count"] else 0.0)
+                for key, stat in self._stats.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+REGISTRY = Registry()
+
+
+class RerunTimings:
+    """
+    1回の再実行の計測値
+    records … [(名前, 秒)]（記録した順）
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.started_at = time.time()
+        self.records = []
+
+    def summary(self):
+        """
+        名前ごとの 回数・合計ミリ秒（合計の大きい順）
+        """
+        rows = {}
+        for name, seconds in self.records:
+            row = rows.setdefault(name, {"名前": name, "回数": 0, "合計ms": 0.0})
+            row["回数"] += 1
+            row["合計ms"] += seconds * 1000
+        return sorted(rows.values(), key=lambda r: -r["合計ms"])
+
+    def to_log(self):
+        return json.dumps({
+            "scope": self.scope,
+            "started_at": self.started_at,
+            "timings": {row["名前"]: round(row["合計ms"], 3) for row in self.summary()},
+        }, ensure_ascii=False)
+
+
+def start_rerun(scope):
+    """
+    再実行の先頭で呼ぶ：以降このスレッドの計測は scope に集計される
+    """
+    timings = RerunTimings(scope)
+    _scope.set(scope)
+    _rerun.set(timings)
+    return timings
+
+
+def record(name, seconds, ok=True):
+    REGISTRY.record(_scope.get(), name, seconds, ok)
+    timings = _rerun.get()
+    if timings is not None:
+        timings.records.append((name, seconds))
+
+
+@contextmanager
+def timed(name):
+    """
+    with timed("load_data"): ... / @timed("load_data")
+    例外が出たらエラーとして数える（例外はそのまま投げる）
+    """
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record(name, time.perf_counter() - start, ok)
+
+
+def log_rerun(timings):
+    """
+    再実行1回分を JSON 1行で "perf" ロガーに出す
+    """
+    if timings.records:
+        logger.info(timings.to_log())
+
+
+# =====================
+# Prometheus 形式
+# =====================
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(registry=REGISTRY, prefix="app"):
+    """
+    Prometheus のテキスト形式（node_exporter の textfile collector などで読む）
+    """
+    stats = registry.snapshot()
+    series = [
+        ("timer_seconds", "summary", "Time spent in instrumented sections", None),
+        ("timer_max_seconds", "gauge", "Slowest single call of an instrumented section", "max"),
+        ("timer_errors_total", "counter", "Instrumented sections that raised", "errors"),
+    ]
+
+    lines = []
+    for suffix, kind, help_text, field in series:
+        metric = f"{prefix}_{suffix}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for (scope, name), stat in sorted(stats.items()):
+            labels = f'{{menu="{_label(scope)}",name="{_label(name)}"}}'
+            if field is None:
+                lines.append(f"{metric}_sum{labels} {stat['total']:.6f}")
+                lines.append(f"{metric}_count{labels} {stat['count']}")
+            else:
+                lines.append(f"{metric}{labels} {stat[field]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, registry=REGISTRY):
+    """
+    書きかけを読まれないよう一時ファイル経由で置き換える
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text(registry))
+    os.replace(tmp, path)
+
+
+def start_exporter(path, interval=15.0, registry=REGISTRY):
+    """
+    interval 秒ごとに path へ書き出すスレッドを起動
+    """
+    def loop():
+        while True:
+            try:
+                write_prometheus(path, registry)
+            except OSError as e:
+                logger.warning("metrics export failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, daemon=True, name="metrics-export")
+    thread.start()
+    return thread
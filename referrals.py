@@ -0,0 +1,146 @@
+"""
+紹介関係のグラフ（紹介者_氏名 → 顧客_ID）
+
+- 紹介者_氏名 は自由入力なので、氏名・ニックネーム（検索と同じ正規化）で顧客に引き当てる
+  「氏名」「ニックネーム」「氏名（ニックネーム）」のどれかで1人に決まる時だけつなぐ
+- 紹介者は1人なので木（森）になる。循環していたらそこで切る
+- 紹介者のいない顧客から段ごとにたどった順を持っておき、連鎖の人数・来店回数は
+  下の段から np.add.at でまとめて足し上げる
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from search_index import normalize, normalize_series
+
+LABEL = re.compile(r"^(.*)[（(](.*)[）)]$")
+
+
+def _unique_map(keys):
+    """
+    正規化した名前 → 行位置（同じ名前が2人以上なら引き当てない）
+    """
+    keys = pd.Series(keys)
+    keys = keys[keys != ""]
+    counts = keys.value_counts()
+    unique = keys[keys.map(counts) == 1]
+    return dict(zip(unique.tolist(), unique.index.tolist()))
+
+
+class ReferralGraph:
+    """
+    df は型付きの customer_df（削除済みも含める：紹介の連鎖は消さない）
+
+    ids      … 行位置 → 顧客_ID
+    parent   … 行位置 → 紹介者の行位置（-1 は紹介者なし / 引き当てられない）
+    levels   … 紹介者のいない顧客から段ごとの行位置
+    descendants … 紹介の連鎖でつながる顧客数（直接＋間接）
+    """
+
+    def __init__(self, df):
+        df = df.drop_duplicates("顧客_ID", keep="last").reset_index(drop=True)
+        self.df = df
+        self.ids = df["顧客_ID"].astype(str).to_numpy()
+        self.position = {cid: pos for pos, cid in enumerate(self.ids)}
+        n = len(df)
+
+        names = normalize_series(df["氏名"]).tolist()
+        nicks = normalize_series(df["ニックネーム"]).tolist()
+        by_name = _unique_map(names)
+        by_nick = _unique_map(nicks)
+        by_label = _unique_map([f"{a}（{b}）" for a, b in zip(names, nicks)])
+
+        # --- 紹介者_氏名 → 行位置（同じ文字列は1回だけ引く） ---
+        texts = df["紹介者_氏名"].fillna("").astype(str)
+        resolved = {text: self._resolve(text, by_name, by_nick, by_label) for text in texts.unique()}
+        parent = texts.map(resolved).to_numpy(dtype=np.int64, copy=True)
+        parent[parent == np.arange(n)] = -1
+        self.parent = parent
+
+        # --- 直接紹介した顧客（紹介者順に並べて開始位置を持つ） ---
+        order = np.argsort(parent, kind="stable")
+        self._child_order = order
+        self._child_starts = np.searchsorted(parent[order], np.arange(-1, n + 1))
+
+        self.levels = self._build_levels()
+        self.descendants = self.below(np.ones(n, dtype=np.int64))
+
+    @staticmethod
+    def _resolve(text, by_name, by_nick, by_label):
+        key = normalize(text)
+        if not key:
+            return -1
+        for table in (by_name, by_nick, by_label):
+            if key in table:
+                return table[key]
+
+        match = LABEL.match(text.strip())
+        if match:
+            key = f"{normalize(match.group(1))}（{normalize(match.group(2))}）"
+            return by_label.get(key, -1)
+        return -1
+
+    def children(self, pos):
+        """
+        直接紹介した顧客の行位置
+        """
+        # _child_starts[0] は parent == -1 の分なので1つずらす
+        return self._child_order[self._child_starts[pos + 1]:self._child_starts[pos + 2]]
+
+    def _build_levels(self):
+        """
+        紹介者のいない顧客から段ごとにたどる
+        循環（A が B を、B が A を紹介など）で届かない顧客は、循環を1か所切ってからたどる
+        """
+        n = len(self.ids)
+        seen = np.zeros(n, dtype=bool)
+        levels = []
+
+        def walk(frontier):
+            while len(frontier):
+                seen[frontier] = True
+                levels.append(frontier)
+                frontier = np.concatenate([self.children(p) for p in frontier])
+
+        walk(np.flatnonzero(self.parent == -1))
+        while not seen.all():
+            # 届かない顧客から紹介者をさかのぼり、2回目に来た顧客の紹介者を切る
+            pos = int(np.flatnonzero(~seen)[0])
+            visited = set()
+            while pos not in visited:
+                visited.add(pos)
+                pos = int(self.parent[pos])
+            self.parent[pos] = -1
+            order = np.argsort(self.parent, kind="stable")
+            self._child_order = order
+            self._child_starts = np.searchsorted(self.parent[order], np.arange(-1, n + 1))
+            walk(np.array([pos]))
+        return levels
+
+    def below(self, values):
+        """
+        自分が紹介した顧客（間接含む）の values の合計
+        values は行位置順の配列
+        """
+        values = np.asarray(values, dtype=np.int64)
+        totals = np.zeros(len(values), dtype=np.int64)
+        for level in reversed(self.levels):
+            level = level[self.parent[level] >= 0]
+            np.add.at(totals, self.parent[level], totals[level] + values[level])
+        return totals
+
+    def visit_counts(self, counts):
+        """
+        counts（顧客_ID → 来店回数）を行位置順の配列に
+        """
+        return pd.Series(self.ids).map(counts).fillna(0).astype("int64").to_numpy()
+
+    def referrer(self, cid):
+        """
+        紹介者の 顧客_ID（引き当てられなければ None）
+        """
+        pos = self.position.get(str(cid))
+        if pos is None or self.parent[pos] < 0:
+            return None
+        return self.ids[self.parent[pos]]
@@ -0,0 +1,125 @@
+"""
+氏名・ニックネーム検索用のインデックス
+
+- 正規化：NFKC（全角英数→半角、半角カナ→全角）＋小文字化＋カタカナ→ひらがな
+- 2文字ごとの転置インデックスで候補を絞り、最後に部分一致で確認
+- データ版ごとに1回だけ作る
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# カタカナ（ァ〜ヶ）→ ひらがな（ぁ〜ゖ）
+KATA_TO_HIRA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+
+def normalize(text):
+    """
+    検索用に表記ゆれを揃える（空白は除く）
+    """
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    return re.sub(r"\s+", "", text.translate(KATA_TO_HIRA))
+
+
+def split_words(query):
+    """
+    空白（全角含む）区切りで検索語に分ける
+    """
+    return [w for w in (normalize(w) for w in re.split(r"\s+", unicodedata.normalize("NFKC", query).strip())) if w]
+
+
+def normalize_series(s):
+    """
+    normalize の Series 版（列ごとまとめて）
+    """
+    return (
+        s.fillna("").astype(str).str.normalize("NFKC").str.lower()
+        .str.translate(KATA_TO_HIRA).str.replace(r"\s+", "", regex=True)
+    )
+
+
+class SearchIndex:
+    """
+    texts[i] は df の i 行目の 氏名＋ニックネーム（正規化済み）
+    """
+
+    def __init__(self, df, columns=("氏名", "ニックネーム")):
+        joined = df[columns[0]].fillna("").astype(str)
+        for col in columns[1:]:
+            joined = joined + df[col].fillna("").astype(str)
+
+        self.texts = normalize_series(joined).tolist()
+        self.labels = df.index
+
+        postings = {}
+        for pos, text in enumerate(self.texts):
+            grams = set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+            for gram in grams:
+                postings.setdefault(gram, []).append(pos)
+        self.postings = {gram: np.asarray(p, dtype=np.int64) for gram, p in postings.items()}
+
+    def _lookup(self, word):
+        """
+        word を含む行の位置
+        """
+        grams = {word} if len(word) == 1 else {word[i:i + 2] for i in range(len(word) - 1)}
+        lists = sorted((self.postings.get(g) for g in grams), key=lambda p: -1 if p is None else len(p))
+        if lists[0] is None:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = lists[0]
+        for p in lists[1:]:
+            candidates = np.intersect1d(candidates, p, assume_unique=True)
+            if not len(candidates):
+                return candidates
+
+        if len(word) <= 2:
+            return candidates
+        return np.asarray([pos for pos in candidates if word in self.texts[pos]], dtype=np.int64)
+
+    def search(self, query):
+        """
+        いずれかの検索語を含む行の index ラベル（空白区切りで OR）
+        """
+        words = split_words(query)
+        if not words:
+            return self.labels
+
+        hits = [self._lookup(w) for w in words]
+        return self.labels[np.unique(np.concatenate(hits))]
+
+
+# =====================
+# 顧客の選択肢（selectbox 用）
+# =====================
+NO_SELECTION = "（未選択）"
+
+
+class CustomerChoices:
+    """
+    options … selectbox の値：先頭が（未選択）、以降はニックネーム順の 顧客_ID
+    labels  … 顧客_ID → 表示ラベル「氏名（ニックネーム）」（format を format_func に渡す）
+    counts を渡すとラベル末尾に（n回）を付ける
+    badges（顧客_ID → バッジ）を渡すとラベル先頭にバッジを付ける
+    値は 顧客_ID なので、回数・バッジが変わってもラベルが変わるだけで選択は外れない
+    """
+
+    def __init__(self, df, counts=None, badges=None):
+        df = df.sort_values("ニックネーム")
+        labels = df["氏名"].astype(str) + "（" + df["ニックネーム"].astype(str) + "）"
+
+        if counts is not None:
+            n = df["顧客_ID"].map(counts).fillna(0).astype(int).astype(str)
+            labels = labels + "（" + n + "回）"
+
+        if badges is not None:
+            badge = df["顧客_ID"].map(badges).fillna("").astype(str)
+            labels = (badge + " ").where(badge != "", "") + labels
+
+        ids = df["顧客_ID"].astype(str).tolist()
+        self.options = [NO_SELECTION] + ids
+        self.labels = dict(zip(ids, labels.tolist()))
+
+    def format(self, cid):
+        return self.labels.get(cid, cid)
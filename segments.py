@@ -0,0 +1,86 @@
+"""
+顧客のセグメント（最終来店からの経過日数・来店回数・在籍日数）
+
+全顧客分を visit の groupby 1回でまとめて出す。
+- 未来店 … 来店記録なし
+- 離反   … 最終来店から lost_days 日より前
+- 休眠   … 来店回数 regular_visits 回以上の常連だったのに、
+            dormant_days 日と普段の来店間隔の3倍のどちらよりも長く来ていない
+- 常連   … 直近1年に regular_visits 回以上
+- 新規   … 初回来店から new_days 日以内
+- 一般   … それ以外
+"""
+import numpy as np
+import pandas as pd
+
+SEGMENTS = ["常連", "休眠", "離反", "新規", "一般", "未来店"]
+BADGES = {"常連": "⭐", "休眠": "💤", "離反": "⚠", "新規": "🆕"}
+
+
+class CustomerSegments:
+    """
+    customer_df / visit_df は型付きのフレーム（日付は datetime64）
+
+    table  … 顧客_ID ごとの 最終来店日・来店回数・直近1年・経過日数・平均間隔・在籍日数・セグメント
+    badges … 顧客_ID → バッジ（一般・未来店は無し）
+    """
+
+    def __init__(self, customer_df, visit_df, today,
+                 dormant_days=90, lost_days=365, regular_visits=6, new_days=90):
+        today = pd.Timestamp(today).normalize()
+        ids = customer_df["顧客_ID"].drop_duplicates(keep="last")
+
+        active = visit_df[(visit_df["削除"] != "1").to_numpy() & visit_df["来店日"].notna().to_numpy()]
+        days = active["来店日"]
+        recent = (days >= today - pd.Timedelta(days=365)).astype("int64")
+        by_customer = pd.DataFrame({"day": days, "recent": recent}).groupby(active["顧客_ID"])
+        agg = by_customer.agg(
+            first=("day", "min"), last=("day", "max"), count=("day", "size"), recent=("recent", "sum")
+        ).reindex(ids)
+
+        count = agg["count"].fillna(0).astype("int64")
+        recency = (today - agg["last"]).dt.days
+        interval = (agg["last"] - agg["first"]).dt.days / (count - 1).where(count > 1)
+
+        first_visit = customer_df.drop_duplicates("顧客_ID", keep="last").set_index("顧客_ID")["初回来店日"]
+        first_visit = first_visit.reindex(ids).fillna(agg["first"])
+        tenure = (today - first_visit).dt.days
+
+        dormant = (
+            (count >= regular_visits)
+            & (recency > np.maximum(dormant_days, (interval * 3).fillna(0)))
+        )
+        segment = np.select(
+            [
+                count == 0,
+                recency > lost_days,
+                dormant,
+                agg["recent"].fillna(0) >= regular_visits,
+                tenure <= new_days,
+            ],
+            ["未来店", "離反", "休眠", "常連", "新規"],
+            default="一般",
+        )
+
+        self.table = pd.DataFrame({
+            "最終来店日": agg["last"],
+            "来店回数": count,
+            "直近1年": agg["recent"].fillna(0).astype("int64"),
+            "経過日数": recency.astype("Int64"),
+            "平均間隔": interval.round(1),
+            "在籍日数": tenure.astype("Int64"),
+            "セグメント": pd.Categorical(segment, categories=SEGMENTS),
+        }, index=ids.to_numpy())
+        self.table.index.name = "顧客_ID"
+        self.badges = self.table["セグメント"].map(BADGES).dropna().astype(str)
+
+    def select(self, segments=None, min_days=0):
+        """
+        セグメント（None なら全部）と 経過日数 の下限で絞った table（経過日数の長い順）
+        """
+        table = self.table
+        if segments:
+            table = table[table["セグメント"].isin(segments)]
+        if min_days:
+            table = table[(table["経過日数"] >= min_days).fillna(False).to_numpy()]
+        return table.sort_values("経過日数", ascending=False, na_position="last")
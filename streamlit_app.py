@@ -12,102 +12,327 @@ textarea {
 </style>
 """, unsafe_allow_html=True)
 
-import requests
+import os
 from datetime import date, datetime
 import pandas as pd
+import requests
 
-GAS_BASE_URL = "https://script.google.com/macros/s/AKfycby8YGTvlubnz6ey7vHhbRd8kd5t8LwiDn5NQKyHsreIrli4YEqJC8vAdkzdbkmIZFbu/exec"
-
-GAS_GET_URL = GAS_BASE_URL + "?action=get"
-GAS_POST_URL = GAS_BASE_URL
-
-@st.cache_data
-def load_data():
-    CUSTOMER_COLUMNS = ["氏名","ニックネーム","住所","電話番号",
-                        "生年月日","勤務先・業種","タバコ_銘柄",
-                        "好き","苦手","初回来店日","紹介者_氏名","メモ_顧客","顧客_ID","削除"]
-
-    VISIT_COLUMNS = ["来店日","曜日","同伴_氏名","担当_氏名",
-                    "延長回数","キープ銘柄","同時来店_氏名","プレゼント_受","プレゼント_渡",
-                    "イベント名","メモ_来店","来店履歴_ID","顧客_ID","削除"]
-
-    # --- GAS から取得 ---
-    res = requests.get(GAS_GET_URL, timeout=30)
-    res.raise_for_status()
-    data = res.json()
-
-    customer_df = pd.DataFrame(data.get("customer", []))
-    visit_df = pd.DataFrame(data.get("visit", []))
+from analytics import StatsCache
+from anniversaries import KINDS, AnniversaryIndex
+from bulk_import import TABLE_SETTINGS, Checkpoint, Importer, clean_chunk, count_rows, read_chunks
+from data_store import WEEKDAYS, SheetStore, Snapshot, typed_frame
+from gas_client import GasClient
+from id_allocator import IdAllocator, gas_reserver
+from instrumentation import BACKGROUND, REGISTRY, log_rerun, start_exporter, start_rerun, timed
+from referrals import ReferralGraph
+from search_index import NO_SELECTION, CustomerChoices, SearchIndex, split_words
+from segments import SEGMENTS, CustomerSegments
+from visit_index import VisitIndex, customer_names, join_names
+from write_queue import WriteQueue
+
+GAS_BASE_URL = os.environ.get(
+    "GAS_BASE_URL",
+    "https://script.google.com/macros/s/AKfycby8YGTvlubnz6ey7vHhbRd8kd5t8LwiDn5NQKyHsreIrli4YEqJC8vAdkzdbkmIZFbu/exec"
+)
+
+# 起動直後はこのファイルから表示 → GAS とは差分だけやり取りする
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", ".cache/snapshot.sqlite3")
+
+# 削除されてからこの日数が過ぎた行はスナップショットのアーカイブへ移す（空なら移さない）
+ARCHIVE_AFTER_DAYS = os.environ.get("ARCHIVE_AFTER_DAYS", "180")
+
+@st.cache_resource
+def get_client():
+    # ★ 接続プールを全セッションで共有
+    return GasClient(GAS_BASE_URL)
+
+@st.cache_resource
+def get_store():
+    # ★ プロセス内で1つだけ（キャッシュクリアでも消えない）
+    snapshot = Snapshot(SNAPSHOT_PATH, backend=GAS_BASE_URL) if SNAPSHOT_PATH else None
+    archive_after_days = int(ARCHIVE_AFTER_DAYS) if ARCHIVE_AFTER_DAYS else None
+    return SheetStore(get_client(), snapshot=snapshot, archive_after_days=archive_after_days)
+
+@st.cache_resource(max_entries=4)
+def get_typed_table(table, version, _df):
+    # ★ 日付・数値・区分の変換は版ごとに1回だけ（全セッションで読み取り専用で共有）
+    return typed_frame(_df, table)
+
+@st.cache_resource(max_entries=2)
+def get_customer_split(version, _customer_df):
+    # ★ 有効 / 削除済み の切り分けも版ごとに1回だけ
+    deleted = _customer_df["削除"] == "1"
+    return _customer_df[~deleted], _customer_df[deleted]
+
+@st.cache_resource(max_entries=4)
+def get_archived_table(table, version):
+    # アーカイブは削除データ一覧・復元の時だけ読み込む
+    df, _ = get_store().archived(table)
+    return typed_frame(df, table)
+
+@timed("load_data")
+def load_data(tables):
+    # --- tables のうち無効化されたものがあれば GAS から差分取得してマージ ---
+    # 使わないテーブルは取得も型変換もせず None を返す
+    customer_raw, visit_raw, versions = get_store().frames(tables)
+    return (
+        get_typed_table("customer", versions["customer"], customer_raw) if "customer" in tables else None,
+        get_typed_table("visit", versions["visit"], visit_raw) if "visit" in tables else None,
+        versions,
+    )
 
-    # --- 空でも列を保証 ---
-    if customer_df.empty:
-        customer_df = pd.DataFrame(columns=CUSTOMER_COLUMNS)
+# GAS 側の mode: "reserve_ids" で ID をブロック予約する（対応済みの GAS のみ）
+GAS_RESERVE_IDS = os.environ.get("GAS_RESERVE_IDS", "") == "1"
 
-    if visit_df.empty:
-        visit_df = pd.DataFrame(columns=VISIT_COLUMNS)
+@st.cache_resource
+def get_id_allocators():
+    # ★ カウンタはプロセスで共有（セッション間で重複しない）
+    client = get_client()
+    return {
+        table: IdAllocator(prefix, reserve=gas_reserver(client, table) if GAS_RESERVE_IDS else None)
+        for table, prefix in (("customer", "C"), ("visit", "V"))
+    }
 
-    # ---  削除列を保証 --- 
-    if "削除" not in customer_df.columns:
-        customer_df["削除"] = ""
+def allocate_id(table):
+    """
+    新しい 顧客_ID / 来店履歴_ID を払い出す
+    既存 ID の最大値はデータ版が変わった時だけ見直す
+    """
+    allocator = get_id_allocators()[table]
+    allocator.observe(*get_store().key_column(table))
+    return allocator.allocate()
 
-    if "削除" not in visit_df.columns:
-        visit_df["削除"] = ""
+# 送信待ちの書き込みをまとめて送る間隔（秒）
+WRITE_FLUSH_INTERVAL = float(os.environ.get("WRITE_FLUSH_INTERVAL", "3"))
 
-    # --- 削除列を正規化 ---
-    customer_df["削除"] = customer_df["削除"].apply(lambda x: "1" if str(x).strip() == "1" else "0")
-    visit_df["削除"] = visit_df["削除"].apply(lambda x: "1" if str(x).strip() == "1" else "0")
+@st.cache_resource
+def get_queue():
+    # ★ 書き込みキューもプロセスで共有（タイマーで自動送信）
+    queue = WriteQueue(get_client(), get_store())
+    queue.start(WRITE_FLUSH_INTERVAL)
+    return queue
 
-    return customer_df, visit_df
+def submit_write(payload):
+    """
+    書き込みをキューに積む（手元のフレームには即反映）
+    ticket はこのセッションの送信状況表示用に残す
+    """
+    ticket = get_queue().submit(payload)
+    st.session_state.setdefault("write_tickets", []).append(ticket)
+    return ticket
+
+# 日付列は日付だけ表示（時刻は出さない）
+DATE_COLUMN_CONFIG = {
+    col: st.column_config.DateColumn(col, format="YYYY-MM-DD")
+    for col in ["生年月日", "初回来店日", "来店日"]
+}
 
 # =====================
-# DataFrame を読み込む
+# ユーティリティ
 # =====================
-customer_df, visit_df = load_data()
+@st.cache_resource(max_entries=2)
+def get_search_index(version, _customer_df):
+    # ★ customer の版ごとに1回だけ作る
+    with timed("search_index"):
+        return SearchIndex(_customer_df)
 
-# ★ 日付列だけ明示的に None に統一
-customer_df["初回来店日"] = customer_df["初回来店日"].where(customer_df["初回来店日"].notna(), None)
-visit_df["来店日"] = visit_df["来店日"].where(visit_df["来店日"].notna(), None)
+def search_customers(df, search_name):
+    """
+    氏名・ニックネームの部分一致（空白を挟んで複数語 → どれかに一致）
+    df は customer_df か、その行の絞り込み（index を共有していること）
+    """
+    if not search_name or not search_name.strip():
+        return df
+
+    index = get_search_index(data_versions["customer"], customer_df)
+    with timed("search"):
+        labels = index.search(search_name)
+        return df[df.index.isin(labels)]
+
+@st.cache_resource(max_entries=2)
+def get_visit_index(version, _visit_df):
+    # ★ 顧客別・日付別の行位置と件数（visit の版ごとに1回だけ）
+    with timed("visit_index"):
+        return VisitIndex(_visit_df)
+
+@st.cache_resource(max_entries=32)
+def get_customer_choices(versions, scope, words, with_counts, with_badges, _df, _counts, _badges):
+    # ★ データ版 × 対象（全件 / 有効のみ）× 検索語 × 来店回数・バッジの有無 ごとに使い回す
+    df = search_customers(_df, " ".join(words))
+    with timed("customer_choices"):
+        return CustomerChoices(df, _counts, _badges)
+
+@st.cache_resource(max_entries=2)
+def get_customer_names(version, _customer_df):
+    return customer_names(_customer_df)
+
+@st.cache_resource(max_entries=2)
+def get_visit_view(versions, _visit_df, _names):
+    # ★ 氏名・ニックネーム付きの来店ビュー（customer / visit どちらかの版が変わった時だけ作り直す）
+    with timed("visit_view"):
+        return join_names(_visit_df, _names)
+
+def visit_view():
+    """
+    氏名・ニックネーム付きの visit_df（行の並びは visit_df と同じ）
+    """
+    names = get_customer_names(data_versions["customer"], customer_df)
+    return get_visit_view((data_versions["customer"], data_versions["visit"]), visit_df, names)
 
-# --- customer ---
-text_cols = customer_df.columns.difference(["生年月日", "初回来店日"])
-customer_df[text_cols] = customer_df[text_cols].fillna("")
+def customer_choices(df, scope, search_name, with_counts=False):
+    """
+    顧客 selectbox の選択肢
+    scope … "all"（customer_df）/ "active"（active_customer_df）
+    来店を読み込んでいる画面ではセグメントのバッジを付ける
+    """
+    with_badges = visit_df is not None
+    versions = (
+        data_versions["customer"],
+        data_versions["visit"] if with_counts or with_badges else None,
+        date.today() if with_badges else None,
+    )
+    counts = get_visit_index(data_versions["visit"], visit_df).customer_counts if with_counts else None
+    badges = customer_segments().badges if with_badges else None
+    words = tuple(split_words(search_name or ""))
+    return get_customer_choices(versions, scope, words, with_counts, with_badges, df, counts, badges)
+
+@st.cache_resource(max_entries=2)
+def get_customer_segments(versions, today, _customer_df, _visit_df):
+    # ★ customer / visit の版と日付ごとに1回だけ（全顧客分をまとめて計算）
+    with timed("customer_segments"):
+        return CustomerSegments(_customer_df, _visit_df, today)
+
+def customer_segments():
+    versions = (data_versions["customer"], data_versions["visit"])
+    return get_customer_segments(versions, date.today(), customer_df, visit_df)
+
+@st.cache_resource(max_entries=2)
+def get_anniversary_index(version, _active_customer_df):
+    # ★ customer の版ごとに1回だけ（有効な顧客の誕生日・初回来店日）
+    with timed("anniversary_index"):
+        return AnniversaryIndex(_active_customer_df)
+
+@st.cache_resource(max_entries=2)
+def get_referral_graph(version, _customer_df):
+    # ★ 紹介者_氏名 の引き当てと連鎖の人数は customer の版ごとに1回だけ
+    with timed("referral_graph"):
+        return ReferralGraph(_customer_df)
+
+@st.cache_resource(max_entries=2)
+def get_referral_visits(versions, _graph, _counts):
+    # (各顧客の来店回数, 紹介の連鎖の来店回数)（customer / visit の版ごと）
+    counts = _graph.visit_counts(_counts)
+    return counts, _graph.below(counts)
+
+def show_referrals(cid):
+    """
+    紹介者と、紹介した顧客（連鎖の人数・来店回数）
+    顧客情報入力では来店を読み込まないので、開いた時だけ読み込む
+    """
+    graph = get_referral_graph(data_versions["customer"], customer_df)
+    pos = graph.position.get(str(cid))
+    if pos is None:
+        return
+
+    _, visit_raw, versions = get_store().frames(("visit",))
+    typed_visit = get_typed_table("visit", versions["visit"], visit_raw)
+    visit_counts = get_visit_index(versions["visit"], typed_visit).customer_counts
+    counts, chain_visits = get_referral_visits(
+        (data_versions["customer"], versions["visit"]), graph, visit_counts
+    )
 
-# --- visit ---
-text_cols_visit = visit_df.columns.difference(["来店日"])
-visit_df[text_cols_visit] = visit_df[text_cols_visit].fillna("")
+    referrer = graph.referrer(cid)
+    intro_text = str(graph.df.at[pos, "紹介者_氏名"] or "")
+    if referrer is not None:
+        ref_row = graph.df.iloc[graph.position[referrer]]
+        st.write(f"紹介者：{ref_row['氏名']}（{ref_row['ニックネーム']}）")
+    elif intro_text:
+        st.write(f"紹介者：{intro_text}（顧客を特定できません）")
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("直接紹介", f"{len(graph.children(pos))}人")
+    col2.metric("紹介の連鎖", f"{graph.descendants[pos]}人")
+    col3.metric("連鎖の来店", f"{chain_visits[pos]}回")
+
+    children = graph.children(pos)
+    if len(children):
+        view = graph.df.iloc[children][["氏名", "ニックネーム"]].assign(
+            来店回数=counts[children],
+            その先の紹介=graph.descendants[children],
+            その先の来店=chain_visits[children],
+        )
+        st.dataframe(view, hide_index=True)
 
-# 通常画面用
-active_customer_df = customer_df[customer_df["削除"] != "1"]
-active_visit_df = visit_df[visit_df["削除"] != "1"]
+@st.cache_resource
+def get_stats_cache():
+    # ★ 集計は最新の1つだけ持ち、visit の版が進んだら変わった行の分だけ更新
+    return StatsCache()
 
-# 削除一覧用
-deleted_customer_df = customer_df[customer_df["削除"] == "1"]
-deleted_visit_df = visit_df[visit_df["削除"] == "1"]
+def visit_stats():
+    """
+    集計メニュー用の VisitStats
+    """
+    store = get_store()
+    with timed("visit_stats"):
+        return get_stats_cache().get(
+            visit_df, data_versions["visit"],
+            lambda since, version: store.changes_since("visit", since, version)
+        )
 
-# =====================
-# ユーティリティ
-# =====================
-def next_id(df, col, prefix):
-    if df.empty:
-        return f"{prefix}00001"
-    nums = df[col].astype(str).str.replace(prefix, "", regex=False)
-    nums = nums[nums.str.isnumeric()].astype(int)
-    return f"{prefix}{nums.max()+1:05d}"
+PAGE_SIZE_OPTIONS = [50, 100, 500]
+
+def paginate(df, key, sort_columns=()):
+    """
+    一覧の表示ページだけ返す（ブラウザへ送るのは見えている分だけ）
+    key          … ウィジェット key の接頭辞
+    sort_columns … 並び替えに使える列（未指定なら df の並びのまま）
+    1ページに収まる件数ならそのまま返す
+    """
+    total = len(df)
+    if total <= PAGE_SIZE_OPTIONS[0]:
+        return df
+
+    col1, col2, col3, col4 = st.columns(4)
+    sort_col = None
+    descending = False
+    if sort_columns:
+        sort_col = col1.selectbox("並び替え", ["（標準）"] + list(sort_columns), key=f"{key}_sort")
+        descending = col2.toggle("降順", key=f"{key}_desc")
+    page_size = col3.selectbox("表示件数", PAGE_SIZE_OPTIONS, key=f"{key}_size")
+
+    pages = -(-total // page_size)
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = col4.number_input(f"ページ（全{pages}）", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+
+    start = (page - 1) * page_size
+    end = min(start + page_size, total)
+
+    if sort_col and sort_col != "（標準）":
+        order = df[sort_col].reset_index(drop=True).sort_values(
+            ascending=not descending, kind="stable", na_position="last"
+        ).index
+        view = df.iloc[order[start:end]]
+    else:
+        view = df.iloc[start:end]
+
+    st.caption(f"全{total}件中 {start + 1}〜{end}件")
+    return view
 
 def safe_date(v):
     """
     st.date_input に渡す専用
     → 必ず datetime.date を返す
     """
-    if v is None:
+    if v is None or v is pd.NaT:
         return date.today()
 
-    if isinstance(v, date):
-        return v
-
     if isinstance(v, datetime):
         return v.date()
 
+    if isinstance(v, date):
+        return v
+
     if isinstance(v, str) and v.strip() != "":
         try:
             return pd.to_datetime(v).date()
@@ -126,8 +351,7 @@ def safe_int(v, default=0):
         return default
 
 def get_weekday(d):
-    jp = ["月", "火", "水", "木", "金", "土", "日"]
-    return jp[d.weekday()]
+    return WEEKDAYS[d.weekday()]
 
 def date_to_str(d):
     if isinstance(d, date):
@@ -184,7 +408,98 @@ def init_state_from_row(state_map, row):
 # =====================
 # サイドバー
 # =====================
-menu = st.sidebar.radio("メニュー",["顧客情報入力","来店情報入力","顧客別来店履歴","日付別来店一覧","削除データ一覧"])
+# メニューごとに使うテーブル（ここに無いテーブルは読み込まない）
+MENU_TABLES = {
+    "顧客情報入力": ("customer",),
+    "来店情報入力": ("customer", "visit"),
+    "顧客別来店履歴": ("customer", "visit"),
+    "日付別来店一覧": ("customer", "visit"),
+    "削除データ一覧": ("customer", "visit"),
+    "集計": ("visit",),
+    "顧客セグメント": ("customer", "visit"),
+    "記念日": ("customer",),
+    "一括取込": ("customer", "visit"),
+}
+
+menu = st.sidebar.radio("メニュー", list(MENU_TABLES))
+
+# --- 計測（以降の計測値はこのメニューに集計） ---
+# 前回の再実行分は st.stop() の後まで含めて出そろっているので、ここでログに出す
+previous_timings = st.session_state.get("perf_timings")
+if previous_timings is not None:
+    log_rerun(previous_timings)
+st.session_state.perf_timings = start_rerun(menu)
+
+# Prometheus のテキスト形式で書き出すファイル（空なら書き出さない）
+METRICS_PATH = os.environ.get("METRICS_PATH", "")
+
+@st.cache_resource
+def get_metrics_exporter():
+    # ★ 書き出しスレッドはプロセスで1つ
+    return start_exporter(METRICS_PATH)
+
+if METRICS_PATH:
+    get_metrics_exporter()
+
+# 計測パネル（DEBUG_PANEL=1 か URL に ?debug=1 で表示）
+DEBUG_PANEL = os.environ.get("DEBUG_PANEL", "") == "1" or st.query_params.get("debug") == "1"
+
+def show_perf_panel(timings):
+    """
+    前回の再実行の内訳と、このメニューのプロセス累計
+    """
+    with st.sidebar.expander("計測"):
+        st.caption("前回の再実行")
+        if timings is None or not timings.records:
+            st.caption("まだ計測値がありません")
+        else:
+            st.dataframe(timings.summary(), hide_index=True)
+
+        st.caption(f"累計（{menu} ＋ バックグラウンド）")
+        rows = [
+            {
+                "対象": "BG" if scope == BACKGROUND else "画面", "名前": name, "回数": stat["count"],
+                "平均ms": stat["avg"] * 1000, "最大ms": stat["max"] * 1000, "エラー": stat["errors"],
+            }
+            for (scope, name), stat in sorted(REGISTRY.snapshot().items())
+            if scope in (menu, BACKGROUND)
+        ]
+        st.dataframe(rows, hide_index=True)
+
+if DEBUG_PANEL:
+    show_perf_panel(previous_timings)
+
+# --- 送信状況（このセッションの書き込み） ---
+WRITE_STATUS_LABELS = {"pending": "⏳ 送信中", "committed": "✅ 保存済", "failed": "⚠ 失敗", "unknown": "？"}
+
+def show_write_status():
+    """
+    サイドバーの送信状況
+    送信待ちがある間は fragment だけ定期更新する（入力中のフォームは再実行しない）
+    """
+    write_queue = get_queue()
+    pending_count = write_queue.pending_count()
+
+    if pending_count:
+        st.caption(f"送信待ち {pending_count}件")
+        if st.button("今すぐ送信"):
+            write_queue.flush_async()
+
+    for ticket in st.session_state.get("write_tickets", [])[-5:][::-1]:
+        result = write_queue.status(ticket)
+        line = f'{WRITE_STATUS_LABELS[result["status"]]} {result["mode"]} {result["key"]}'
+        if result["status"] == "failed":
+            st.error(f'{line} {result["message"]}')
+        else:
+            st.caption(line)
+
+has_pending = any(
+    get_queue().status(t)["status"] == "pending"
+    for t in st.session_state.get("write_tickets", [])
+)
+
+with st.sidebar:
+    st.fragment(show_write_status, run_every=2 if has_pending else None)()
 
 # ★ メニュー切替を検知して初期化
 if "prev_menu" not in st.session_state:
@@ -201,12 +516,38 @@ if menu_changed:
     st.session_state.pop("search_visit_name", None)
     st.session_state.customer_mode_radio = "新規顧客"
 
-    # ★ キャッシュだけクリア
-    st.cache_data.clear()
-
     # ★ 最後に prev_menu 更新
     st.session_state.prev_menu = menu
 
+# =====================
+# DataFrame を読み込む
+# =====================
+# ★ 型変換済み（日付は datetime64）・読み取り専用なので直接書き換えないこと
+customer_df, visit_df, data_versions = load_data(MENU_TABLES[menu])
+
+# 通常画面用 / 削除一覧用
+if customer_df is not None:
+    active_customer_df, deleted_customer_df = get_customer_split(data_versions["customer"], customer_df)
+
+# --- 他の端末の更新 ---
+# 更新の取得は裏で1本だけ走り、その間は今の版のまま表示する
+DATA_POLL_INTERVAL = float(os.environ.get("DATA_POLL_INTERVAL", "10"))
+
+def show_data_updates():
+    """
+    表示中の版より新しい版があれば知らせる（fragment だけ定期実行）
+    """
+    store = get_store()
+    store.sync(tables=MENU_TABLES[menu])
+    latest = store.current_versions()
+    if any(latest[table] != data_versions[table] for table in MENU_TABLES[menu]):
+        st.info("新しいデータがあります")
+        if st.button("最新を表示"):
+            st.rerun()
+
+with st.sidebar:
+    st.fragment(show_data_updates, run_every=DATA_POLL_INTERVAL)()
+
 # =====================
 # 顧客情報入力
 # =====================
@@ -264,31 +605,13 @@ if menu == "顧客情報入力":
 
     if customer_mode == "既存顧客" and not customer_df.empty:
         search_name = st.text_input("氏名・ニックネーム検索（部分一致：空白を挟んで入力で複数検索可）", "")
-        search_col = customer_df["氏名"].fillna("") + customer_df["ニックネーム"].fillna("")
-
-        if search_name:
-            import re
-            search_words = re.split(r"\s+", search_name.strip())
-            mask = pd.Series(False, index=customer_df.index)
-            for w in search_words:
-                if w:
-                    mask |= search_col.str.contains(w, case=False, na=False)
-            filtered_df = customer_df[mask]
-        else:
-            filtered_df = customer_df
-
-        name_labels = ["（未選択）"]
-        name_map = {}
-
-        for _, r in filtered_df.sort_values("ニックネーム").iterrows():
-            label = f'{r["氏名"]}（{r["ニックネーム"]}）'
-            name_labels.append(label)
-            name_map[label] = r["顧客_ID"]
+        choices = customer_choices(customer_df, "all", search_name)
 
-        selected_label = st.selectbox("氏名・ニックネームを選択", name_labels, key="input_selected_customer_name")
+        selected_id = st.selectbox("氏名・ニックネームを選択", choices.options, format_func=choices.format,
+                                   key="input_selected_customer_name")
 
-        if selected_label != "（未選択）":
-            cid = name_map[selected_label]
+        if selected_id != NO_SELECTION:
+            cid = selected_id
             row = customer_df[customer_df["顧客_ID"] == cid].iloc[0].to_dict()
 
             cid = row["顧客_ID"]
@@ -329,8 +652,12 @@ if menu == "顧客情報入力":
     # =====================
     if customer_mode == "新規顧客":
         init_state_from_row(CUSTOMER_STATE_MAP, {})
-        cid = next_id(customer_df, "顧客_ID", "C")
-        st.session_state.current_customer_id = cid        
+
+        # ★ 新規フォームごとに1回だけ払い出す（保存したら次の番号）
+        if not st.session_state.get("new_customer_id"):
+            st.session_state.new_customer_id = allocate_id("customer")
+        cid = st.session_state.new_customer_id
+        st.session_state.current_customer_id = cid
         is_deleted = False
     else:
         # ★ 必ず session_state から
@@ -398,8 +725,7 @@ if menu == "顧客情報入力":
             "顧客_ID": cid,
             "削除": "1"
         }
-        requests.post(GAS_POST_URL, json=payload)
-        st.cache_data.clear()
+        submit_write(payload)
         st.session_state.flash_message = "削除しました ✅"
         st.rerun()
 
@@ -409,8 +735,7 @@ if menu == "顧客情報入力":
             "顧客_ID": cid,
             "削除": "0"
         }
-        requests.post(GAS_POST_URL, json=payload)
-        st.cache_data.clear()
+        submit_write(payload)
         st.session_state.flash_message = "復元しました ✅"
         st.rerun()
       
@@ -442,20 +767,21 @@ if menu == "顧客情報入力":
             "削除": "0"
         }
 
-        with st.spinner("保存中です…"):
-            requests.post(GAS_POST_URL, json=payload, timeout=30)
+        submit_write(payload)
+        st.session_state.pop("new_customer_id", None)
 
-        # --- 日付カラムを文字列に変換 ---
-        for col in ["生年月日", "初回来店日"]:
-            if col in customer_df.columns:
-                customer_df[col] = customer_df[col].astype(str)
-
-        # ★ ここで必ずキャッシュ破棄＋再読込
-        st.cache_data.clear()         
+        # ★ 手元の customer に反映済み → 再読込なし
         st.session_state.loaded_customer_id = cid
         st.session_state.flash_message = "保存しました ✅"
         st.rerun()
 
+    # ==================
+    # 紹介関係
+    # ==================
+    if customer_mode == "既存顧客" and cid:
+        if st.toggle("紹介関係を表示", key="show_referrals"):
+            show_referrals(cid)
+
 # =====================
 # 来店情報入力
 # =====================
@@ -488,31 +814,13 @@ elif menu == "来店情報入力":
     cid = st.session_state.get("current_customer_id", "")    
     
     search_name = st.text_input("氏名・ニックネーム検索（部分一致：空白を挟んで入力で複数検索可）", "")
-    search_col = active_customer_df["氏名"].fillna("") + active_customer_df["ニックネーム"].fillna("")
-
-    if search_name:
-        import re
-        search_words = re.split(r"\s+", search_name.strip())
-        mask = pd.Series(False, index=active_customer_df.index)
-        for w in search_words:
-            if w:
-                mask |= search_col.str.contains(w, case=False, na=False)
-        filtered_df = active_customer_df[mask]
-    else:
-        filtered_df = active_customer_df
+    choices = customer_choices(active_customer_df, "active", search_name)
 
-    name_labels = ["（未選択）"]
-    name_map = {}
+    selected_id = st.selectbox("氏名・ニックネームを選択", choices.options, format_func=choices.format,
+                               key="input_selected_customer_name")
 
-    for _, r in filtered_df.sort_values("ニックネーム").iterrows():
-        label = f'{r["氏名"]}（{r["ニックネーム"]}）'
-        name_labels.append(label)
-        name_map[label] = r["顧客_ID"]
-
-    selected_label = st.selectbox("氏名・ニックネームを選択", name_labels, key="input_selected_customer_name")
-
-    if selected_label != "（未選択）":
-        cid = name_map[selected_label]
+    if selected_id != NO_SELECTION:
+        cid = selected_id
         row = customer_df[customer_df["顧客_ID"] == cid].iloc[0].to_dict()
         st.session_state.current_customer_id = cid
 
@@ -528,9 +836,10 @@ elif menu == "来店情報入力":
     vid = st.session_state.get("current_visit_id", "")    
 
     if visit_mode == "既存来店履歴を編集":
-        target_visits = visit_df[visit_df["顧客_ID"] == cid]
+        visit_index = get_visit_index(data_versions["visit"], visit_df)
+        target_visits = visit_index.customer_visits(cid)
 
-        visit_record = visit_df[visit_df["来店履歴_ID"] == st.session_state.get("selected_visit_id")]
+        visit_record = visit_index.visit(st.session_state.get("selected_visit_id"))
 
         if not visit_record.empty:
             visit_record = visit_record.iloc[0]
@@ -541,16 +850,15 @@ elif menu == "来店情報入力":
         if target_visits.empty:
             st.info("編集できる来店履歴がありません")
         else:
-            # --- 日付を datetime に変換 ---
-            target_visits["来店日_dt"] = pd.to_datetime(target_visits["来店日"], errors="coerce")
-
-            # --- 新しい順に並べる ---
-            target_visits = target_visits.sort_values("来店日_dt", ascending=False)
+            # --- 新しい順に並べる（来店日は読み込み時に datetime 済み） ---
+            target_visits = target_visits.sort_values("来店日", ascending=False)
 
             # --- 表示ラベル作成 ---
-            visit_labels = target_visits.apply(
-                lambda r: f'{r["来店日_dt"].date()}（{get_weekday(r["来店日_dt"])}）{r["来店履歴_ID"]}',
-                axis=1
+            visit_days = target_visits["来店日"]
+            visit_labels = (
+                visit_days.dt.strftime("%Y-%m-%d").fillna("NaT") + "（"
+                + visit_days.dt.weekday.map(dict(enumerate(WEEKDAYS))).fillna("") + "）"
+                + target_visits["来店履歴_ID"]
             )
 
             visit_map = dict(zip(visit_labels, target_visits["来店履歴_ID"]))
@@ -578,7 +886,7 @@ elif menu == "来店情報入力":
                     vid = st.session_state.get("selected_visit_id")
 
                     if vid:
-                        target = visit_df[visit_df["来店履歴_ID"] == vid]
+                        target = visit_index.visit(vid)
                         if not target.empty:
                             is_deleted = str(target.iloc[0].get("削除", "0")) == "1"
 
@@ -595,6 +903,8 @@ elif menu == "来店情報入力":
                         val = visit_row.get(col, default)
                         if isinstance(default, date):
                             val = safe_date(val)
+                        elif isinstance(default, int):
+                            val = safe_int(val, default)
                         st.session_state[key] = val
 
                     st.session_state.loaded_visit_id = vid
@@ -655,8 +965,7 @@ elif menu == "来店情報入力":
                 "来店履歴_ID": vid
             }
 
-            requests.post(GAS_POST_URL, json=payload)
-            st.cache_data.clear()
+            submit_write(payload)
             st.session_state.flash_message = "削除しました ✅"
             st.rerun()
 
@@ -665,8 +974,7 @@ elif menu == "来店情報入力":
             "mode": "visit_restore",
             "来店履歴_ID": vid,
         }
-        requests.post(GAS_POST_URL, json=payload)
-        st.cache_data.clear()
+        submit_write(payload)
         st.session_state.flash_message = "復元しました ✅"
         st.rerun()
             
@@ -686,7 +994,7 @@ elif menu == "来店情報入力":
             st.stop()
 
         if visit_mode == "新規来店":
-            vid = next_id(visit_df, "来店履歴_ID", "V")
+            vid = allocate_id("visit")
         else:
             vid = st.session_state.get("selected_visit_id")
             if not vid:
@@ -711,17 +1019,10 @@ elif menu == "来店情報入力":
             "削除": "0"
         }
     
-        with st.spinner("保存中です…"):
-            requests.post(GAS_POST_URL, json=payload, timeout=30)
-
-        # --- 日付カラムを文字列に変換 ---
-        for col in ["来店日"]:
-            if col in visit_df.columns:
-                visit_df[col] = visit_df[col].astype(str)
+        submit_write(payload)
 
         # 来店保存後
         st.session_state.after_visit_save = True
-        st.cache_data.clear()
 
         st.session_state.selected_visit_id = vid
 
@@ -741,57 +1042,24 @@ elif menu == "顧客別来店履歴":
 
     # ① 検索ボックス（常に定義するのが重要）
     search_name = st.text_input("氏名・ニックネーム検索（部分一致：空白を挟んで入力で複数検索可）",key="search_customer_name")
-    search_col = active_customer_df["氏名"].fillna("") + active_customer_df["ニックネーム"].fillna("")
-
-    # ② 検索結果で顧客を絞り込む
-    if search_name:
-        import re
-        search_words = re.split(r"\s+", search_name.strip())
-        mask = pd.Series(False, index=active_customer_df.index)
-        for w in search_words:
-            if w:
-                mask |= search_col.str.contains(w, case=False, na=False)
-        filtered_df = active_customer_df[mask]
-    else:
-        filtered_df = active_customer_df
 
-    # ③ selectbox（必ず表示・未選択あり）
-    # 来店回数を集計
-    visit_count = active_visit_df.groupby("顧客_ID").size().to_dict()
+    # ② 検索結果で顧客を絞り込み、③ selectbox（必ず表示・未選択あり）
+    # 来店回数付きラベル（五十音順）
+    choices = customer_choices(active_customer_df, "active", search_name, with_counts=True)
 
-    # 表示ラベル作成
-    name_labels = ["（未選択）"]
-    name_map = {}
+    selected_id = st.selectbox("氏名・ニックネームで選択", choices.options, format_func=choices.format,
+                               key="history_selected_customer_name")
 
-    # 五十音順で並べる
-    filtered_df = filtered_df.sort_values("ニックネーム", ascending=True)
-
-    for _, row in filtered_df.iterrows():
-        cid = row["顧客_ID"]
-        name = row["氏名"]
-        nickname = row["ニックネーム"]
-        count = visit_count.get(cid, 0)
-
-        label = f"{name}（{nickname}）（{count}回）"
-        name_labels.append(label)
-        name_map[label] = cid
-
-    selected_label = st.selectbox("氏名・ニックネームで選択", name_labels,
-                                key="history_selected_customer_name")
-
-    if selected_label == "（未選択）":
+    if selected_id == NO_SELECTION:
         st.info("顧客・ニックネームを選択してください")
     else:
-        cid = name_map[selected_label]
+        cid = selected_id
 
-        target = active_visit_df[visit_df["顧客_ID"] == cid].copy()
+        target = get_visit_index(data_versions["visit"], visit_df).customer_visits(cid, active_only=True).copy()
 
         if target.empty:
             st.warning("来店履歴がありません")
         else:
-            # 日付を datetime に
-            target["来店日"] = pd.to_datetime(target["来店日"])
-
             # 古い順で番号
             target = target.sort_values("来店日", ascending=True)
             target["No"] = range(1, len(target) + 1)
@@ -799,8 +1067,8 @@ elif menu == "顧客別来店履歴":
             # 表示は新しい順
             target = target.sort_values(["来店日","No"], ascending=[False,False])
 
-            # 時刻を消す
-            target["来店日"] = target["来店日"].dt.date
+            # 表示するページだけ切り出してから列を絞る
+            target = paginate(target, "history", ["来店日", "担当_氏名", "延長回数", "イベント名"])
 
             # 顧客ID・来店履歴ID・削除は消す
             target = target.drop(columns=["顧客_ID", "来店履歴_ID","削除"], errors="ignore")
@@ -809,7 +1077,7 @@ elif menu == "顧客別来店履歴":
             cols = ["No"] + [c for c in target.columns if c != "No"]
             target = target[cols]
 
-            st.dataframe(target, hide_index=True)
+            st.dataframe(target, hide_index=True, column_config=DATE_COLUMN_CONFIG)
 
 # =====================
 # 日付別来店一覧
@@ -817,20 +1085,19 @@ elif menu == "顧客別来店履歴":
 elif menu == "日付別来店一覧":
     st.header("日付別来店一覧")
 
-    # ★① データ準備
-    df = active_visit_df.copy()
-    df["来店日"] = pd.to_datetime(df["来店日"]).dt.date
+    # ★① データ準備（日付ごとの行位置・件数は visit の版ごとに作成済み）
+    visit_index = get_visit_index(data_versions["visit"], visit_df)
 
-    # ★② 来店日一覧（存在する日付のみ）
-    date_list = sorted(df["来店日"].dropna().unique(), reverse=True)
+    # ★② 来店日一覧（存在する日付のみ・新しい順）と件数
+    date_count = visit_index.date_counts
+    date_list = [d.date() for d in date_count.index]
 
     if not date_list:
         st.warning("来店データがありません")
         st.stop()
 
     # ★③ 表示用ラベル
-    date_count = df.groupby("来店日").size().to_dict()
-    date_labels = ["（日付を選択）"] + [f"{d}({get_weekday(pd.to_datetime(d))})（{date_count[d]}件）"for d in date_list]
+    date_labels = ["（日付を選択）"] + [f"{d}({get_weekday(d)})（{n}件）" for d, n in zip(date_list, date_count.tolist())]
 
     # ★④ selectbox
     selected_label = st.selectbox("来店日を選択",date_labels,index=0,key="visit_date_select")
@@ -842,19 +1109,17 @@ elif menu == "日付別来店一覧":
     # ★⑤ 表示ラベル → 実日付
     selected_date = date_list[date_labels.index(selected_label) - 1]
 
-    # ★⑥ 来店一覧抽出
-    target = df[df["来店日"] == selected_date].copy()
-
-    target["来店日"] = pd.to_datetime(target["来店日"])
-
-    # 顧客ID → 氏名・ニックネームに変換
-    target = target.merge(customer_df[["顧客_ID", "氏名","ニックネーム"]], on="顧客_ID", how="left")
+    # ★⑥ 来店一覧抽出（氏名・ニックネームは結合済みのビューから）
+    target = visit_index.date_visits(selected_date, visit_view())
 
     # ★氏名昇順で並べる
     target = target.sort_values("氏名", ascending=True)
 
     # ★その順でNoを振る
-    target["No"] = range(1, len(target) + 1)
+    target = target.assign(No=range(1, len(target) + 1))
+
+    # 表示するページだけ切り出してから列を絞る
+    target = paginate(target, "visit_date", ["氏名", "ニックネーム", "担当_氏名", "延長回数", "No"])
 
     # 来店日・曜日・顧客ID・来店履歴ID・削除は消す
     target = target.drop(columns=["来店日", "曜日","顧客_ID", "来店履歴_ID","削除"], errors="ignore")
@@ -871,37 +1136,62 @@ elif menu == "日付別来店一覧":
 elif menu == "削除データ一覧":
     st.header("削除データ一覧")
 
-    # 日付だけ表示に変換
-    date_cols = ["生年月日", "初回来店日", "来店日"]
+    # --- 古い削除データ（アーカイブ）は必要な時だけ読み込む ---
+    show_archived = st.checkbox("アーカイブ済みの削除データも表示", key="show_archived")
+
+    deleted_visit_df = get_visit_index(data_versions["visit"], visit_df).deleted_visits(visit_view())
 
-    for col in date_cols:
-        if col in deleted_customer_df.columns:
-            deleted_customer_df[col] = pd.to_datetime(
-                deleted_customer_df[col], errors="coerce"
-            ).dt.date
+    if show_archived:
+        store = get_store()
+        archived_customer = get_archived_table("customer", store.archive_version("customer"))
+        archived_visit = get_archived_table("visit", store.archive_version("visit"))
+        archived_visit = join_names(archived_visit, get_customer_names(data_versions["customer"], customer_df))
 
-        if col in deleted_visit_df.columns:
-            deleted_visit_df[col] = pd.to_datetime(
-                deleted_visit_df[col], errors="coerce"
-            ).dt.date
+        deleted_customer_df = pd.concat([deleted_customer_df, archived_customer], ignore_index=True)
+        deleted_visit_df = pd.concat([deleted_visit_df, archived_visit], ignore_index=True)
+
+        # --- アーカイブからの復元 ---
+        restore_map = {
+            f'顧客 {r["顧客_ID"]} {r["氏名"]}（{r["ニックネーム"]}）': ("customer_restore", "顧客_ID", r["顧客_ID"])
+            for r in archived_customer[["顧客_ID", "氏名", "ニックネーム"]].to_dict("records")
+        }
+        restore_map.update({
+            f'来店 {r["来店履歴_ID"]} {"" if pd.isna(r["来店日"]) else r["来店日"].date()} {r["氏名"]}': ("visit_restore", "来店履歴_ID", r["来店履歴_ID"])
+            for r in archived_visit[["来店履歴_ID", "来店日", "氏名"]].to_dict("records")
+        })
+
+        if restore_map:
+            col1, col2 = st.columns([3, 1])
+            restore_label = col1.selectbox("アーカイブから復元", [NO_SELECTION] + list(restore_map), key="archive_restore_select")
+            if col2.button("復元", disabled=restore_label == NO_SELECTION):
+                mode, key, value = restore_map[restore_label]
+                payload = {"mode": mode, key: value}
+                if mode == "customer_restore":
+                    payload["削除"] = "0"
+                submit_write(payload)
+                st.session_state.flash_message = "復元しました ✅"
+                st.rerun()
+
+        if "flash_message" in st.session_state:
+            st.success(st.session_state.flash_message)
 
     # ==================
-    # 表示用
+    # 表示用（ページ単位で切り出してから列を絞る）
     # ==================
     # 顧客情報-------
-    view_customer = deleted_customer_df.drop(
+    st.subheader("顧客")
+    view_customer = paginate(deleted_customer_df, "deleted_customer", ["氏名", "ニックネーム", "初回来店日"])
+    view_customer = view_customer.drop(
         columns=["顧客_ID", "削除"],
         errors="ignore"
     )
+    st.dataframe(view_customer, hide_index=True, column_config=DATE_COLUMN_CONFIG)
 
     # 来店履歴情報-------
-    # 顧客名を結合
-    deleted_visit_df = deleted_visit_df.merge(
-        customer_df[["顧客_ID", "氏名", "ニックネーム"]],
-        on="顧客_ID",
-        how="left"
-    )
-    view_visit = deleted_visit_df.drop(
+    # 顧客名は結合済みのビューから
+    st.subheader("来店履歴")
+    view_visit = paginate(deleted_visit_df, "deleted_visit", ["来店日", "氏名", "ニックネーム"])
+    view_visit = view_visit.drop(
         columns=["顧客_ID", "来店履歴_ID", "削除"],
         errors="ignore"
     )
@@ -911,7 +1201,170 @@ elif menu == "削除データ一覧":
 
     view_visit = view_visit[cols]
 
-    st.subheader("顧客")
-    st.dataframe(view_customer, hide_index=True)
-    st.subheader("来店履歴")
-    st.dataframe(view_visit, hide_index=True)
\ No newline at end of file
+    st.dataframe(view_visit, hide_index=True, column_config=DATE_COLUMN_CONFIG)
+
+# =====================
+# 集計
+# =====================
+elif menu == "集計":
+
+    stats = visit_stats()
+    st.caption("削除済みの来店は含みません")
+
+    # 月別 -------
+    st.subheader("月別来店数")
+    monthly = stats.monthly()
+    st.bar_chart(monthly.set_index("月").sort_index()["来店数"])
+    st.dataframe(monthly, hide_index=True)
+
+    # 曜日別 -------
+    st.subheader("曜日別来店数")
+    weekdays = stats.weekdays()
+    st.bar_chart(weekdays.set_index("曜日")["来店数"], sort=False)
+
+    # 担当別 -------
+    st.subheader("担当別")
+    st.dataframe(stats.staff(), hide_index=True)
+
+    # イベント別 -------
+    st.subheader("イベント別")
+    st.dataframe(stats.events(), hide_index=True)
+
+# =====================
+# 顧客セグメント
+# =====================
+elif menu == "顧客セグメント":
+
+    segments = customer_segments()
+    st.caption("削除済みの顧客・来店は含みません（経過日数は今日時点）")
+
+    col1, col2 = st.columns(2)
+    selected_segments = col1.multiselect("セグメント", SEGMENTS, default=["休眠"], key="segment_filter")
+    min_days = col2.number_input("最終来店からの経過日数（以上）", min_value=0, step=30, key="segment_min_days")
+
+    target = segments.select(selected_segments, min_days)
+    target = target[target.index.isin(active_customer_df["顧客_ID"])]
+
+    if target.empty:
+        st.info("該当する顧客はいません")
+        st.stop()
+
+    # 顧客名を付ける（並びはセグメント側のまま）
+    names = get_customer_names(data_versions["customer"], customer_df)
+    view = names.reindex(target.index).join(target).reset_index(drop=True)
+    view = paginate(view, "segment", ["経過日数", "来店回数", "直近1年", "在籍日数", "氏名", "ニックネーム"])
+    st.dataframe(view, hide_index=True, column_config=DATE_COLUMN_CONFIG | {
+        "最終来店日": st.column_config.DateColumn("最終来店日", format="YYYY-MM-DD")
+    })
+
+# =====================
+# 記念日
+# =====================
+elif menu == "記念日":
+
+    col1, col2 = st.columns(2)
+    days = col1.number_input("今日から何日以内", min_value=0, max_value=365, value=30, step=1, key="anniversary_days")
+    kinds = col2.multiselect("種別", list(KINDS), default=list(KINDS), key="anniversary_kinds")
+
+    index = get_anniversary_index(data_versions["customer"], active_customer_df)
+    target = index.upcoming(date.today(), int(days), kinds)
+
+    if target.empty:
+        st.info("該当する記念日はありません")
+        st.stop()
+
+    target = target.assign(曜日=target["日付"].map(get_weekday))
+    view = target[["日付", "曜日", "あと何日", "種別", "年数", "氏名", "ニックネーム", "生年月日", "初回来店日", "電話番号"]]
+    view = paginate(view, "anniversary", ["日付", "氏名", "ニックネーム"])
+    st.dataframe(view, hide_index=True, column_config=DATE_COLUMN_CONFIG | {
+        "日付": st.column_config.DateColumn("日付", format="YYYY-MM-DD")
+    })
+
+# =====================
+# 一括取込
+# =====================
+elif menu == "一括取込":
+
+    # 途中まで取り込んだファイルの続き（チェックポイント）の置き場所
+    IMPORT_CHECKPOINT_DIR = os.environ.get("IMPORT_CHECKPOINT_DIR", ".cache/imports")
+    IMPORT_PREVIEW_ROWS = 100
+
+    table_label = st.radio("取り込み先", ["顧客", "来店"], horizontal=True, key="import_table")
+    table = {"顧客": "customer", "来店": "visit"}[table_label]
+    columns, key_column, _ = TABLE_SETTINGS[table]
+    st.caption(f"1行目が列名の CSV / Excel。列名：{'、'.join(columns)}（{key_column} が空の行は新しく払い出します）")
+
+    uploaded = st.file_uploader("ファイル", type=["csv", "xlsx"], key="import_file")
+    if uploaded is None:
+        st.stop()
+
+    data = uploaded.getvalue()
+    known_customers = set(customer_df["顧客_ID"].astype(str))
+
+    # 確認（先頭だけ読んで検証） -------
+    try:
+        preview = next(read_chunks(data, uploaded.name, IMPORT_PREVIEW_ROWS), None)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        st.error(f"ファイルを読み込めません：{e}")
+        st.stop()
+
+    if preview is None or preview.empty:
+        st.info("データ行がありません")
+        st.stop()
+
+    header = [str(c).strip() for c in preview.columns]
+    ignored = [c for c in header if c not in columns]
+    lacking = [c for c in columns if c not in header]
+    if ignored:
+        st.caption(f"取り込まない列：{'、'.join(ignored)}")
+    if lacking:
+        st.caption(f"ファイルに無い列（空で取り込み）：{'、'.join(lacking)}")
+
+    rows, errors = clean_chunk(preview, table, known_customers)
+    st.caption(f"先頭{len(preview)}行の確認：取り込める {len(rows)}件 / エラー {len(errors)}件")
+    st.dataframe(rows, hide_index=True)
+    if errors:
+        st.dataframe(errors, hide_index=True)
+
+    # 前回の続き -------
+    checkpoint = Checkpoint(IMPORT_CHECKPOINT_DIR, table, data, uploaded.name)
+    if checkpoint.finished:
+        st.success("このファイルは取り込み済みです")
+        if st.button("もう一度取り込む"):
+            checkpoint.clear()
+            st.rerun()
+        st.stop()
+    if checkpoint.done or checkpoint.pending:
+        st.warning(f"前回 {checkpoint.done}行目まで取り込み済みです。続きから取り込みます")
+        if st.button("最初から取り込む"):
+            checkpoint.clear()
+            st.rerun()
+
+    if not st.button("取込開始", type="primary"):
+        st.stop()
+
+    allocator = get_id_allocators()[table]
+    allocator.observe(*get_store().key_column(table))
+    importer = Importer(
+        table, data, uploaded.name, checkpoint, allocator, get_queue().post_batch, get_store(),
+        known_customers=known_customers,
+    )
+
+    total = count_rows(data, uploaded.name)
+    progress = st.progress(0.0, text="取り込み中…")
+    done = checkpoint.done
+    try:
+        for done, imported, failed in importer.run():
+            ratio = min(done / total, 1.0) if total else 0.0
+            progress.progress(ratio, text=f"{done} / {total or '?'}行　取り込み {imported}件　エラー {failed}件")
+    except requests.RequestException as e:
+        st.error(f"通信エラーで止まりました（{done}行目まで取り込み済み）。同じファイルを選ぶと続きから取り込めます：{e}")
+    else:
+        progress.progress(1.0, text=f"完了　取り込み {importer.imported}件　エラー {len(importer.errors)}件")
+    finally:
+        # 送った行はサーバ側の最終状態に合わせ直す
+        get_store().reconcile_async((table,))
+
+    if importer.errors:
+        st.subheader("取り込めなかった行")
+        st.dataframe(importer.errors, hide_index=True)
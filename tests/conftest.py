@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tools")]
+
+from data_store import CUSTOMER_COLUMNS, VISIT_COLUMNS  # noqa: E402
+from fake_gas import FakeGas, serve  # noqa: E402
+from gas_client import GasClient  # noqa: E402
+
+
+def customer(cid, name, deleted="0", **extra):
+    """
+    シートと同じく全列そろった顧客行
+    """
+    return dict(dict.fromkeys(CUSTOMER_COLUMNS, ""), 氏名=name, 顧客_ID=cid, 削除=deleted, **extra)
+
+
+def visit(vid, cid, day, deleted="0", **extra):
+    """
+    シートと同じく全列そろった来店行
+    """
+    return dict(dict.fromkeys(VISIT_COLUMNS, ""), 来店日=day, 来店履歴_ID=vid, 顧客_ID=cid, 削除=deleted, **extra)
+
+
+@pytest.fixture
+def gas():
+    """
+    顧客3人・来店4件の GAS 代替サーバ
+    """
+    gas = FakeGas(
+        [customer("C00001", "山田"), customer("C00002", "佐藤"), customer("C00003", "鈴木", deleted="1")],
+        [
+            visit("V00001", "C00001", "2024-05-01"),
+            visit("V00002", "C00001", "2024-05-08"),
+            visit("V00003", "C00002", "2024-05-08"),
+            visit("V00004", "C00003", "2024-04-01", deleted="1"),
+        ],
+    )
+    server, url = serve(gas)
+    gas.url = url
+    yield gas
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(gas):
+    return GasClient(gas.url, retries=0)
@@ -0,0 +1,23 @@
+from data_store import SheetStore, typed_frame
+from analytics import StatsCache, VisitStats
+
+
+def test_incremental_stats_match_rebuild(gas, client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    cache = StatsCache()
+
+    df = typed_frame(store.visit_df, "visit")
+    cache.get(df, store.versions["visit"], lambda a, b: store.changes_since("visit", a, b))
+
+    store.write_through({"mode": "visit_only", "来店履歴_ID": "V00005", "顧客_ID": "C00002",
+                         "来店日": "2024-06-03", "担当_氏名": "A", "延長回数": "2", "削除": "0"})
+    store.write_through({"mode": "visit_delete", "来店履歴_ID": "V00001"})
+
+    df = typed_frame(store.visit_df, "visit")
+    stats = cache.get(df, store.versions["visit"], lambda a, b: store.changes_since("visit", a, b))
+    rebuilt = VisitStats(df)
+
+    for name in ("monthly", "weekdays", "staff", "events"):
+        assert getattr(stats, name)().equals(getattr(rebuilt, name)())
+    assert stats.monthly().set_index("月")["来店数"].to_dict() == {"2024-06": 1, "2024-05": 2}
@@ -0,0 +1,32 @@
+from datetime import date
+
+import pandas as pd
+
+from anniversaries import AnniversaryIndex
+
+
+def index(birthdays):
+    return AnniversaryIndex(pd.DataFrame({
+        "氏名": [f"n{i}" for i in range(len(birthdays))],
+        "生年月日": pd.to_datetime(birthdays),
+        "初回来店日": pd.to_datetime([None] * len(birthdays)),
+    }))
+
+
+def test_feb29_shown_on_feb28_in_common_years():
+    idx = index(["2000-02-29", "1990-02-28", "1990-03-01"])
+
+    common = idx.upcoming(date(2025, 2, 28), 0, ["誕生日"])
+    assert sorted(common["氏名"]) == ["n0", "n1"]
+
+    leap = idx.upcoming(date(2024, 2, 28), 1, ["誕生日"])
+    assert leap.set_index("氏名")["あと何日"].to_dict() == {"n1": 0, "n0": 1}
+
+
+def test_upcoming_wraps_year_end():
+    idx = index(["1990-12-31", "1990-01-02"])
+
+    result = idx.upcoming(date(2025, 12, 30), 3, ["誕生日"])
+
+    assert result["日付"].dt.strftime("%Y-%m-%d").tolist() == ["2025-12-31", "2026-01-02"]
+    assert result["年数"].tolist() == [35, 36]
@@ -0,0 +1,53 @@
+from data_store import SheetStore, Snapshot
+from id_allocator import IdAllocator
+
+
+def test_archived_ids_are_not_reissued(client, tmp_path):
+    path = str(tmp_path / "snapshot.sqlite3")
+    store = SheetStore(client, snapshot=Snapshot(path))
+    store.sync(wait=True)
+    store.snapshot.archive("customer", store.customer_df[store.customer_df["顧客_ID"] == "C00003"])
+
+    # 別プロセス：スナップショットから起動して差分だけ取る
+    fresh = SheetStore(client, snapshot=Snapshot(path))
+    fresh.sync(force=True, wait=True)
+    assert "C00003" not in set(fresh.customer_df["顧客_ID"])
+
+    allocator = IdAllocator("C")
+    allocator.observe(*fresh.key_column("customer"))
+    assert allocator.allocate() == "C00004"
+
+
+def live_ids(store):
+    return set(store.customer_df["顧客_ID"])
+
+
+def test_rows_age_from_deletion_not_from_dates(gas, client, tmp_path):
+    path = str(tmp_path / "snapshot.sqlite3")
+    store = SheetStore(client, snapshot=Snapshot(path), archive_after_days=180)
+    store.sync(wait=True)
+
+    # 初回来店日が古い顧客を今削除しても、すぐにはアーカイブしない
+    gas.post({"mode": "customer_only", "顧客_ID": "C00001", "氏名": "山田", "初回来店日": "2000-01-01", "削除": "0"})
+    gas.post({"mode": "customer_delete", "顧客_ID": "C00001"})
+    store.sync(force=True, wait=True)
+    assert {"C00001", "C00003"} <= live_ids(store)
+    assert store.snapshot.archived_keys("customer").empty
+
+    # 保持期間が過ぎたら（ここでは 0 日）アーカイブへ
+    later = SheetStore(client, snapshot=Snapshot(path), archive_after_days=0)
+    later.sync(force=True, wait=True)
+    assert not {"C00001", "C00003"} & live_ids(later)
+    assert set(later.snapshot.archived_keys("customer")) == {"C00001", "C00003"}
+
+    # フル再同期でも削除のままの行はアーカイブに残る
+    later.reset()
+    later.sync(wait=True)
+    assert not {"C00001", "C00003"} & live_ids(later)
+    assert set(later.snapshot.archived_keys("customer")) == {"C00001", "C00003"}
+
+    # サーバ側で復元されたら通常側に戻り、削除時刻の記録も消える
+    gas.post({"mode": "customer_restore", "顧客_ID": "C00003"})
+    later.sync(force=True, wait=True)
+    assert "C00003" in live_ids(later)
+    assert "C00003" not in later.snapshot.load_deleted_at("customer")
@@ -0,0 +1,82 @@
+import pytest
+import requests
+
+from bulk_import import Checkpoint, Importer
+from data_store import SheetStore
+from id_allocator import IdAllocator
+from write_queue import WriteQueue
+
+
+def customers_csv(n):
+    lines = ["氏名,ニックネーム"] + [f"客{i},きゃく{i}" for i in range(n)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def importer(store, queue, data, directory, post_batch=None):
+    """
+    再起動後と同じく、サーバに届いた ID だけ見た新しい IdAllocator で作る
+    """
+    allocator = IdAllocator("C")
+    allocator.observe(*store.key_column("customer"))
+    checkpoint = Checkpoint(str(directory), "customer", data, "customers.csv")
+    return Importer("customer", data, "customers.csv", checkpoint, allocator,
+                    post_batch or queue.post_batch, store)
+
+
+def test_resume_after_restart_does_not_overwrite(gas, client, tmp_path):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    queue = WriteQueue(client, store)
+    data = customers_csv(1200)
+
+    calls = []
+
+    def flaky(payloads):
+        calls.append(len(payloads))
+        if len(calls) == 7:
+            raise requests.ConnectionError("down")
+        return queue.post_batch(payloads)
+
+    first = importer(store, queue, data, tmp_path, flaky)
+    with pytest.raises(requests.ConnectionError):
+        list(first.run())
+    assert first.checkpoint.done == 500
+
+    # 別プロセスで再開
+    resumed_store = SheetStore(client)
+    resumed_store.sync(wait=True)
+    resumed = importer(resumed_store, queue, data, tmp_path)
+    progress = list(resumed.run())
+
+    assert progress[-1][0] == 1200
+    assert resumed.checkpoint.finished
+    assert len(gas.tables["customer"]) == 3 + 1200
+    names = {row["氏名"] for row in gas.tables["customer"].values()}
+    assert {f"客{i}" for i in range(1200)} <= names
+
+
+def test_generated_ids_skip_ids_given_in_file(gas, client, tmp_path):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    data = "氏名,顧客_ID\n新1,\n新2,C00004\n新3,\n".encode("utf-8")
+
+    run = importer(store, WriteQueue(client, store), data, tmp_path)
+    list(run.run())
+
+    ids = {row["氏名"]: cid for cid, row in gas.tables["customer"].items()}
+    assert ids["新2"] == "C00004"
+    assert len({ids["新1"], ids["新2"], ids["新3"]}) == 3
+    assert run.imported == 3 and not run.errors
+
+
+def test_duplicate_ids_in_file_are_rejected(gas, client, tmp_path):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    data = "氏名,顧客_ID\n甲,C00010\n乙,\n丙,C00010\n".encode("utf-8")
+
+    run = importer(store, WriteQueue(client, store), data, tmp_path)
+    list(run.run())
+
+    assert [e["行"] for e in run.errors] == [2, 4]
+    assert "C00010" not in gas.tables["customer"]
+    assert {row["氏名"] for row in gas.tables["customer"].values()} >= {"乙"}
@@ -0,0 +1,152 @@
+import threading
+from datetime import timedelta, timezone
+
+import pandas as pd
+
+import data_store
+from data_store import CUSTOMER_COLUMNS, SheetStore, merge_rows, normalize_rows
+
+
+class DeltaFailingClient:
+    """
+    差分取得（since あり）だけ失敗する GAS
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def get(self, since=None, table=None):
+        self.calls.append(since)
+        if since is not None:
+            raise ValueError("broken delta")
+        return self.client.get(since=since, table=table)
+
+
+def names(store):
+    return dict(zip(store.customer_df["顧客_ID"], store.customer_df["氏名"]))
+
+
+# =====================
+# merge_rows
+# =====================
+def test_merge_rows_updates_in_place_and_appends():
+    base = normalize_rows([{"顧客_ID": "C1", "氏名": "a"}, {"顧客_ID": "C2", "氏名": "b"}], CUSTOMER_COLUMNS)
+    changed = normalize_rows(
+        [{"顧客_ID": "C2", "氏名": "x"}, {"顧客_ID": "C3", "氏名": "c"}, {"顧客_ID": "C2", "氏名": "y"}],
+        CUSTOMER_COLUMNS,
+    )
+    merged = merge_rows(base, changed, "顧客_ID")
+
+    assert merged["顧客_ID"].tolist() == ["C1", "C2", "C3"]
+    assert merged["氏名"].tolist() == ["a", "y", "c"]
+    # 元のフレームは書き換えない
+    assert base["氏名"].tolist() == ["a", "b"]
+
+
+def test_merge_rows_empty_sides():
+    base = normalize_rows([{"顧客_ID": "C1", "氏名": "a"}], CUSTOMER_COLUMNS)
+    empty = normalize_rows([], CUSTOMER_COLUMNS)
+
+    assert merge_rows(base, empty, "顧客_ID") is base
+    assert merge_rows(empty, base, "顧客_ID")["顧客_ID"].tolist() == ["C1"]
+
+
+# =====================
+# SheetStore.apply / _refresh
+# =====================
+def test_sync_merges_delta(gas, client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    assert len(store.customer_df) == 3 and len(store.visit_df) == 4
+    version = store.versions["customer"]
+
+    gas.post({"mode": "customer_only", "顧客_ID": "C00002", "氏名": "佐藤2", "削除": "0"})
+    store.sync(force=True, tables=("customer",), wait=True)
+
+    assert names(store)["C00002"] == "佐藤2"
+    assert store.revs["customer"] == gas.rev
+    assert store.changes_since("customer", version, store.versions["customer"]) == {"C00002"}
+
+
+def test_apply_without_rev_replaces_everything(gas, client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+
+    store.apply({"customer": [{"顧客_ID": "C00009", "氏名": "新"}]}, since=store.revs["customer"], tables=("customer",))
+
+    assert names(store) == {"C00009": "新"}
+    assert store.revs["customer"] is None
+
+
+def test_refresh_falls_back_to_full_fetch(gas, client):
+    failing = DeltaFailingClient(client)
+    store = SheetStore(failing)
+    store.sync(wait=True)
+    version = store.versions["customer"]
+
+    gas.post({"mode": "customer_only", "顧客_ID": "C00004", "氏名": "高橋", "削除": "0"})
+    store.sync(force=True, wait=True)
+
+    assert failing.calls == [None, gas.rev - 1, None]
+    assert names(store)["C00004"] == "高橋"
+    # フル取得を挟んだので差分はわからない
+    assert store.changes_since("customer", version, store.versions["customer"]) is None
+
+
+def test_refresh_error_marks_tables_dirty(gas, client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    gas_url, client.base_url = client.base_url, "http://127.0.0.1:9/exec"
+
+    try:
+        store.sync(force=True, wait=True)
+    except Exception:
+        pass
+    assert store.is_stale("customer") and store.is_stale("visit")
+
+    client.base_url = gas_url
+    store.sync(wait=True)
+    assert not store.is_stale("customer")
+
+
+def test_frames_not_blocked_while_applying(gas, client, monkeypatch):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    entered, release = threading.Event(), threading.Event()
+    original = data_store.merge_rows
+
+    def slow_merge(*args):
+        entered.set()
+        release.wait(5)
+        return original(*args)
+
+    monkeypatch.setattr(data_store, "merge_rows", slow_merge)
+    gas.post({"mode": "customer_only", "顧客_ID": "C00002", "氏名": "佐藤2", "削除": "0"})
+    refresh = threading.Thread(target=store.sync, kwargs={"force": True, "wait": True})
+    refresh.start()
+    assert entered.wait(5)
+
+    # マージ中でも今の版はすぐ返る
+    result = []
+    reader = threading.Thread(target=lambda: result.append(store.frames()))
+    reader.start()
+    reader.join(1)
+    assert result and names(store)["C00002"] == "佐藤"
+
+    release.set()
+    refresh.join(5)
+    assert names(store)["C00002"] == "佐藤2"
+
+
+
+# =====================
+# to_dates
+# =====================
+def test_to_dates_mixes_naive_and_tz_aware(monkeypatch):
+    monkeypatch.setattr(data_store, "LOCAL_TZ", timezone(timedelta(hours=9)))
+    s = pd.Series(["2024-05-01", "2024-05-01T15:00:00.000Z", "2024/5/3 10:00+09:00", "", "不明"])
+
+    assert data_store.to_dates(s).dt.strftime("%Y-%m-%d").fillna("").tolist() == [
+        "2024-05-01", "2024-05-02", "2024-05-03", "", "",
+    ]
@@ -0,0 +1,51 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+from gas_client import columnar_frame, decode_tables, unpack
+
+
+def packed(data):
+    payload = base64.b64encode(gzip.compress(json.dumps(data).encode("utf-8"))).decode("ascii")
+    return {"encoding": "gzip+base64", "payload": payload}
+
+
+def test_unpack_opens_gzip_base64_envelope():
+    data = {"rev": 3, "customer": [{"顧客_ID": "C00001"}]}
+
+    assert unpack(packed(data)) == data
+    assert unpack(data) is data
+
+
+def test_columnar_frame_resolves_dictionary_columns():
+    df = columnar_frame({
+        "columns": ["顧客_ID", "曜日"],
+        "values": [["C00001", "C00002", "C00003"], [1, -1, 0]],
+        "dictionaries": {"曜日": ["月", "火"]},
+    })
+
+    assert df.columns.tolist() == ["顧客_ID", "曜日"]
+    assert df["曜日"].fillna("").tolist() == ["火", "", "月"]
+
+
+def test_columnar_frame_rejects_length_mismatch():
+    with pytest.raises(ValueError):
+        columnar_frame({"columns": ["顧客_ID", "氏名"], "values": [["C00001"]]})
+
+
+def test_decode_tables_keeps_row_format_as_is():
+    rows = [{"顧客_ID": "C00001", "氏名": "山田"}]
+    columnar = {"columns": ["来店履歴_ID"], "values": [["V00001"]]}
+
+    data = decode_tables(packed({"rev": 5, "customer": rows, "visit": columnar}))
+
+    assert data["rev"] == 5
+    assert data["customer"] == rows
+    assert data["visit"]["来店履歴_ID"].tolist() == ["V00001"]
+
+
+def test_decode_tables_rejects_non_dict():
+    with pytest.raises(ValueError):
+        decode_tables([1, 2])
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from referrals import ReferralGraph
+
+CUSTOMERS = [
+    # 顧客_ID, 氏名, ニックネーム, 紹介者_氏名
+    ("C01", "山田", "やま", ""),
+    ("C02", "佐藤", "さと", "山田"),
+    ("C03", "鈴木", "すず", "サト"),            # ニックネーム（カナ）
+    ("C04", "田中", "たな", "佐藤（さと）"),     # 氏名（ニックネーム）
+    ("C05", "伊藤", "いと", ""),
+    ("C06", "伊藤", "いとう", ""),
+    ("C07", "高橋", "たか", "伊藤"),            # 同名2人 → つながない
+    ("C08", "自分", "じぶん", "自分"),          # 自分自身
+    ("C09", "甲", "こう", "乙"),                # 循環
+    ("C10", "乙", "おつ", "甲"),
+]
+
+
+def graph():
+    df = pd.DataFrame(CUSTOMERS, columns=["顧客_ID", "氏名", "ニックネーム", "紹介者_氏名"])
+    return ReferralGraph(df)
+
+
+def descendants(g):
+    return dict(zip(g.ids, g.descendants.tolist()))
+
+
+def test_referrers_resolve_by_name_nickname_and_label():
+    g = graph()
+
+    assert g.referrer("C02") == "C01"
+    assert g.referrer("C03") == "C02"
+    assert g.referrer("C04") == "C02"
+    assert g.referrer("C01") is None
+
+
+def test_ambiguous_and_self_referrals_stay_unlinked():
+    g = graph()
+
+    assert g.referrer("C07") is None
+    assert g.referrer("C08") is None
+    assert descendants(g)["C05"] == descendants(g)["C06"] == 0
+
+
+def test_cycle_is_cut_and_every_customer_is_reached_once():
+    g = graph()
+
+    reached = np.concatenate(g.levels)
+    assert sorted(reached.tolist()) == list(range(len(CUSTOMERS)))
+    assert [g.referrer("C09"), g.referrer("C10")].count(None) == 1
+    assert descendants(g)["C09"] + descendants(g)["C10"] == 1
+
+
+def test_descendants_and_below_totals():
+    g = graph()
+
+    assert descendants(g)["C01"] == 3
+    assert descendants(g)["C02"] == 2
+    assert descendants(g)["C03"] == 0
+
+    below = dict(zip(g.ids, g.below(g.visit_counts({"C01": 9, "C02": 2, "C03": 5, "C04": 1})).tolist()))
+    assert below["C01"] == 8
+    assert below["C02"] == 6
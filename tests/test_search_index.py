@@ -0,0 +1,55 @@
+import pandas as pd
+
+from search_index import NO_SELECTION, CustomerChoices, SearchIndex
+
+
+def test_choice_values_are_ids_and_survive_badge_changes():
+    df = pd.DataFrame({"氏名": ["山田", "佐藤"], "ニックネーム": ["やま", "さと"], "顧客_ID": ["C1", "C2"]})
+
+    before = CustomerChoices(df, counts={"C1": 3}, badges={"C1": "💤"})
+    after = CustomerChoices(df, counts={"C1": 4}, badges={})
+
+    assert before.options == after.options == [NO_SELECTION, "C2", "C1"]
+    assert before.format("C1") == "💤 山田（やま）（3回）"
+    assert after.format("C1") == "山田（やま）（4回）"
+    assert after.format(NO_SELECTION) == NO_SELECTION
+
+
+# =====================
+# SearchIndex
+# =====================
+def index():
+    df = pd.DataFrame(
+        {"氏名": ["山田 太郎", "サトウ", "Ｍａｒｙ", "やままだ"], "ニックネーム": ["ﾀﾛｰ", "さとちゃん", "", None]},
+        index=["a", "b", "c", "d"],
+    )
+    return SearchIndex(df)
+
+
+def test_search_folds_width_case_and_kana():
+    idx = index()
+
+    assert list(idx.search("たろー")) == ["a"]      # 半角カナ → 全角 → ひらがな
+    assert list(idx.search("さとう")) == ["b"]      # カタカナ ↔ ひらがな
+    assert list(idx.search("ｻﾄﾁｬﾝ")) == ["b"]
+    assert list(idx.search("mary")) == ["c"]        # 全角英字 → 半角・小文字
+    assert list(idx.search("田太")) == ["a"]        # 氏名の空白は無視
+
+
+def test_search_short_and_long_words():
+    idx = index()
+
+    assert list(idx.search("ま")) == ["d"]
+    assert list(idx.search("や")) == ["d"]
+    assert list(idx.search("まだ")) == ["d"]
+    # 2文字ずつは揃っていても続いていなければ当たらない
+    assert list(idx.search("やまだ")) == []
+    assert list(idx.search("ままだ")) == ["d"]
+
+
+def test_search_words_are_or_and_blank_returns_all():
+    idx = index()
+
+    assert list(idx.search("山田　mary")) == ["a", "c"]
+    assert list(idx.search("山田 該当なし")) == ["a"]
+    assert list(idx.search("  ")) == ["a", "b", "c", "d"]
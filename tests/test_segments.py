@@ -0,0 +1,64 @@
+import pandas as pd
+
+from segments import CustomerSegments
+
+TODAY = "2024-12-31"
+
+
+def visits(cid, last, every, count=6, deleted="0"):
+    days = pd.date_range(end=last, periods=count, freq=f"{every}D")
+    return [(cid, day, deleted) for day in days]
+
+
+def segments(**options):
+    customers = pd.DataFrame(
+        [
+            ("none", None), ("lost", None), ("regular", None),
+            ("dormant", None), ("dormant_edge", None), ("dormant_3x", None), ("spread_3x_edge", None),
+            ("new", None), ("old_first", "2020-01-01"), ("plain", None),
+        ],
+        columns=["顧客_ID", "初回来店日"],
+    )
+    customers["初回来店日"] = pd.to_datetime(customers["初回来店日"])
+
+    rows = (
+        visits("none", "2024-12-01", 1, count=1, deleted="1")  # 削除済みは数えない
+        + visits("lost", "2023-12-30", 10)                    # 367日前 > 365日
+        + visits("regular", "2024-12-01", 30)
+        + visits("dormant", "2024-08-01", 10)                 # 152日 > 90日（間隔10日の3倍より長い）
+        + visits("dormant_edge", "2024-10-02", 10)            # ちょうど90日 → まだ休眠ではない
+        + visits("dormant_3x", "2024-07-01", 60)              # 183日 > 間隔60日の3倍
+        + visits("spread_3x_edge", "2024-07-04", 60)          # ちょうど180日 → 休眠ではない
+        + visits("new", "2024-11-01", 1, count=1)
+        + visits("old_first", "2024-11-15", 1, count=1)       # 初回来店日が古いので新規ではない
+        + visits("plain", "2024-06-01", 1, count=1)
+    )
+    visit_df = pd.DataFrame(rows, columns=["顧客_ID", "来店日", "削除"])
+    return CustomerSegments(customers, visit_df, TODAY, **options)
+
+
+def test_each_rule():
+    table = segments().table
+
+    assert table["セグメント"].astype(str).to_dict() == {
+        "none": "未来店",
+        "lost": "離反",
+        "regular": "常連",
+        "dormant": "休眠",
+        "dormant_edge": "常連",
+        "dormant_3x": "休眠",
+        "spread_3x_edge": "一般",
+        "new": "新規",
+        "old_first": "一般",
+        "plain": "一般",
+    }
+    assert table.loc["dormant_3x", "平均間隔"] == 60
+    assert table.loc["none", "来店回数"] == 0
+
+
+def test_thresholds_are_options_and_badges_follow():
+    s = segments(dormant_days=30, regular_visits=7)
+
+    assert s.table.loc["dormant_edge", "セグメント"] == "一般"   # 7回未満なので常連でも休眠でもない
+    assert s.badges.to_dict() == {"lost": "⚠", "new": "🆕"}
+    assert s.select(["離反", "新規"]).index.tolist() == ["lost", "new"]
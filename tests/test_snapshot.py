@@ -0,0 +1,44 @@
+import pytest
+
+from data_store import SheetStore, Snapshot
+
+
+def test_snapshot_from_other_backend_is_discarded(client, tmp_path):
+    path = str(tmp_path / "snapshot.sqlite3")
+    store = SheetStore(client, snapshot=Snapshot(path, backend=client.base_url))
+    store.sync(wait=True)
+
+    assert Snapshot(path, backend=client.base_url).load() is not None
+    assert Snapshot(path, backend="https://example.invalid/other").load() is None
+    # 捨てた後は元の接続先でも空から
+    assert Snapshot(path, backend=client.base_url).load() is None
+
+
+def test_snapshot_with_other_columns_is_discarded(client, tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.sqlite3")
+    store = SheetStore(client, snapshot=Snapshot(path, backend=client.base_url))
+    store.sync(wait=True)
+
+    columns, key = Snapshot.SCHEMA["customer"]
+    monkeypatch.setitem(Snapshot.SCHEMA, "customer", (columns + ["ランク"], key))
+    snapshot = Snapshot(path, backend=client.base_url)
+    assert snapshot.load() is None
+    snapshot.upsert("customer", store.customer_df.assign(ランク="A"))
+
+
+def test_failed_replace_keeps_rows_and_rev(client, tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.sqlite3")
+    store = SheetStore(client, snapshot=Snapshot(path, backend=client.base_url))
+    store.sync(wait=True)
+    revs, before, _ = store.snapshot.load()
+
+    def broken(table, df):
+        raise RuntimeError("disk")
+
+    monkeypatch.setattr(store.snapshot, "_records", broken)
+    with pytest.raises(RuntimeError):
+        store.snapshot.replace("customer", before.iloc[:1], 99)
+
+    after_revs, after, _ = Snapshot(path, backend=client.base_url).load()
+    assert after_revs == revs
+    assert set(after["顧客_ID"]) == set(before["顧客_ID"])
@@ -0,0 +1,55 @@
+import requests
+
+from data_store import SheetStore
+from write_queue import WriteQueue
+
+
+class DownClient:
+    """
+    POST だけ通信エラーになる GAS
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, since=None, table=None):
+        return self.client.get(since=since, table=table)
+
+    def post(self, payload):
+        raise requests.ConnectionError("down")
+
+
+def test_flush_commits_batch(gas, client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    queue = WriteQueue(client, store)
+
+    first = queue.submit({"mode": "customer_only", "顧客_ID": "C00004", "氏名": "高橋", "削除": "0"})
+    second = queue.submit({"mode": "visit_delete", "来店履歴_ID": "V00001"})
+    queue.flush()
+
+    assert queue.status(first)["status"] == "committed"
+    assert queue.status(second)["status"] == "committed"
+    assert gas.tables["customer"]["C00004"]["氏名"] == "高橋"
+    assert gas.tables["visit"]["V00001"]["削除"] == "1"
+
+
+def test_flush_failure_rolls_back_on_next_sync(gas, client):
+    store = SheetStore(DownClient(client))
+    store.sync(wait=True)
+    queue = WriteQueue(store.client, store)
+
+    ticket = queue.submit({"mode": "customer_only", "顧客_ID": "C00004", "氏名": "高橋", "削除": "0"})
+    # submit した時点で手元には反映済み
+    assert "C00004" in set(store.customer_df["顧客_ID"])
+
+    queue.flush()
+
+    result = queue.status(ticket)
+    assert result["status"] == "failed" and "down" in result["message"]
+    assert store.revs == {"customer": None, "visit": None}
+
+    # 次の同期はフル取得になり、送れなかった行は消える
+    store.sync(wait=True)
+    assert "C00004" not in set(store.customer_df["顧客_ID"])
+    assert queue.pending_count() == 0
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from data_store import CUSTOMER_COLUMNS, SheetStore
+
+
+def test_write_through_updates_frame_and_logs_key(client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    version = store.versions["customer"]
+
+    store.write_through({"mode": "customer_delete", "顧客_ID": "C00001"})
+
+    row = store.customer_df[store.customer_df["顧客_ID"] == "C00001"].iloc[0]
+    assert row["削除"] == "1" and row["氏名"] == "山田"
+    assert store.changes_since("customer", version, store.versions["customer"]) == {"C00001"}
+
+
+def test_write_through_adds_new_row(client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+
+    store.write_through({"mode": "visit_only", "来店履歴_ID": "V00009", "顧客_ID": "C00002", "来店日": "2024-06-01"})
+
+    row = store.visit_df[store.visit_df["来店履歴_ID"] == "V00009"].iloc[0]
+    assert row["顧客_ID"] == "C00002" and row["削除"] == "0"
+
+
+def test_write_rows_merges_once(client):
+    store = SheetStore(client)
+    store.sync(wait=True)
+    version = store.versions["customer"]
+
+    rows = pd.DataFrame([{"顧客_ID": "C00010", "氏名": "一"}, {"顧客_ID": "C00011", "氏名": "二"}])
+    store.write_rows("customer", rows.reindex(columns=CUSTOMER_COLUMNS, fill_value=""))
+
+    assert store.versions["customer"] == version + 1
+    assert {"C00010", "C00011"} <= set(store.customer_df["顧客_ID"])
@@ -0,0 +1,265 @@
+"""
+ベンチマーク
+
+合成した顧客・来店データをローカルの GAS 代替サーバ（fake_gas）から配り、
+データ量ごとに次の処理時間を測る:
+
+- load … GAS からのフル取得・差分取得と型変換（load_data 相当）
+- search … 検索インデックスの構築と検索
+- render … 各メニューの初回表示（派生データ作成込み）と再表示（AppTest）
+- save … 保存ボタンの再実行と、GAS に書き込まれるまでの往復
+
+結果は1回ごとに JSON Lines に追記し、同じデータ量の前回結果と比べて表示する:
+
+    $ python tools/bench.py --visits 10000 100000
+    $ python tools/bench.py --visits 1000000 --skip-render --label after-change
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_gas import FakeGas, serve  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+MENUS = ["顧客情報入力", "来店情報入力", "顧客別来店履歴", "日付別来店一覧", "削除データ一覧", "集計", "顧客セグメント", "記念日"]
+
+SURNAMES = [
+    "佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤",
+    "吉田", "山田", "佐々木", "山口", "松本", "井上", "木村", "林", "斎藤", "清水",
+]
+GIVEN_NAMES = [
+    "翔太", "大輔", "健一", "直樹", "誠", "浩二", "拓也", "亮", "悠斗", "蓮",
+    "美咲", "陽子", "由美", "愛", "真由美", "結衣", "さくら", "明美", "恵", "彩",
+]
+NICKNAMES = ["しょう", "ダイ", "けん", "なお", "マコ", "こう", "たく", "リョウ", "ゆう", "レン"]
+STAFF = ["あや", "みく", "りな", "ゆき", "まい"]
+SEARCH_QUERIES = ["佐藤", "たなか", "ケン", "美", "山 林", "存在しない名前"]
+
+
+# =====================
+# 合成データ
+# =====================
+def generate(n_customers, n_visits, seed=0, today=None):
+    """
+    {"customer": [...], "visit": [...]}（シートの行と同じ形）
+    約5% を削除済みにする
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+
+    def day(max_days):
+        return (today - timedelta(days=rng.randrange(max_days))).isoformat()
+
+    customer = []
+    for i in range(1, n_customers + 1):
+        customer.append({
+            "氏名": rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+            "ニックネーム": f"{rng.choice(NICKNAMES)}{i}",
+            "住所": "", "電話番号": "",
+            "生年月日": (date(1960, 1, 1) + timedelta(days=rng.randrange(365 * 45))).isoformat(),
+            "勤務先・業種": "", "タバコ_銘柄": "", "好き": "", "苦手": "",
+            "初回来店日": day(365 * 5),
+            "紹介者_氏名": "", "メモ_顧客": "",
+            "顧客_ID": f"C{i:05d}",
+            "削除": "1" if rng.random() < 0.05 else "0",
+        })
+
+    visit = []
+    for i in range(1, n_visits + 1):
+        visit_day = day(365 * 5)
+        visit.append({
+            "来店日": visit_day,
+            "曜日": "", "同伴_氏名": "",
+            "担当_氏名": rng.choice(STAFF),
+            "延長回数": rng.randrange(4),
+            "キープ銘柄": "", "同時来店_氏名": "", "プレゼント_受": "", "プレゼント_渡": "",
+            "イベント名": "", "メモ_来店": "",
+            "来店履歴_ID": f"V{i:05d}",
+            "顧客_ID": f"C{rng.randrange(1, n_customers + 1):05d}",
+            "削除": "1" if rng.random() < 0.05 else "0",
+        })
+
+    return {"customer": customer, "visit": visit}
+
+
+# =====================
+# 計測
+# =====================
+class Timer:
+    """
+    metrics … 計測名 → 秒
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def measure(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.metrics[name] = time.perf_counter() - start
+        print(f"  {name:<32} {self.metrics[name] * 1000:10.1f} ms", flush=True)
+        return result
+
+
+def bench_load(timer, url, gas):
+    from data_store import SheetStore, typed_frame
+    from gas_client import GasClient
+
+    store = SheetStore(GasClient(url))
+    customer_raw, visit_raw, _ = timer.measure("load.full", store.frames)
+    timer.measure("load.typed_customer", typed_frame, customer_raw, "customer")
+    visit_df = timer.measure("load.typed_visit", typed_frame, visit_raw, "visit")
+
+    gas.post({"mode": "visit_only", "来店履歴_ID": "V00001", "担当_氏名": "bench"})
+    timer.measure("load.delta", store.sync, force=True, tables=("visit",), wait=True)
+    return typed_frame(customer_raw, "customer"), visit_df
+
+
+def bench_search(timer, customer_df, visit_df):
+    from search_index import CustomerChoices, SearchIndex
+    from visit_index import VisitIndex
+
+    index = timer.measure("search.build_index", SearchIndex, customer_df)
+    timer.measure("search.query_x%d" % len(SEARCH_QUERIES), lambda: [index.search(q) for q in SEARCH_QUERIES])
+    visit_index = timer.measure("search.build_visit_index", VisitIndex, visit_df)
+    timer.measure("search.choices", CustomerChoices, customer_df, visit_index.customer_counts)
+
+
+def run_app(at):
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception)
+    return at
+
+
+def bench_render(timer, gas):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_resource.clear()
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    timer.measure("render.startup", run_app, at)
+
+    for menu in MENUS:
+        at.sidebar.radio[0].set_value(menu)
+        timer.measure(f"render.{menu}.first", run_app, at)
+        timer.measure(f"render.{menu}.rerun", run_app, at)
+
+    # 検索（顧客別来店履歴の検索欄）
+    at.sidebar.radio[0].set_value("顧客別来店履歴")
+    run_app(at)
+    at.text_input(key="search_customer_name").set_value("佐藤")
+    timer.measure("render.search", run_app, at)
+
+    # 保存：ボタンの再実行 → GAS に届くまで
+    at.sidebar.radio[0].set_value("顧客情報入力")
+    run_app(at)
+    before = len(gas.tables["customer"])
+    at.text_input(key="input_name").set_value("計測 太郎")
+    [b for b in at.button if b.label == "顧客情報_保存"][0].click()
+    start = time.perf_counter()
+    timer.measure("save.rerun", run_app, at)
+    while len(gas.tables["customer"]) == before:
+        if time.perf_counter() - start > 60:
+            raise RuntimeError("save did not reach GAS within 60s")
+        time.sleep(0.01)
+    timer.metrics["save.round_trip"] = time.perf_counter() - start
+    print(f'  {"save.round_trip":<32} {timer.metrics["save.round_trip"] * 1000:10.1f} ms', flush=True)
+
+
+# =====================
+# レポート
+# =====================
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(current, previous):
+    """
+    前回（同じデータ量）との比較表
+    """
+    print(f'\n== {current["customers"]} customers / {current["visits"]} visits '
+          f'({current["label"] or current["git"]} vs {previous["label"] or previous["git"] if previous else "-"})')
+    for name, sec in current["metrics"].items():
+        line = f"  {name:<32} {sec * 1000:10.1f} ms"
+        before = previous["metrics"].get(name) if previous else None
+        if before:
+            line += f"  {before * 1000:10.1f} ms  {(sec - before) / before * 100:+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成データでのベンチマーク")
+    parser.add_argument("--visits", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--customers", type=int, help="顧客数（省略時は来店件数の1/10）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="結果に付ける名前（比較表示用）")
+    parser.add_argument("--out", default=os.path.join(ROOT, ".cache", "bench.jsonl"))
+    parser.add_argument("--skip-render", action="store_true", help="AppTest での画面計測を省く")
+    args = parser.parse_args()
+
+    # アプリはスナップショット無し・短い送信間隔で計測する
+    os.environ["SNAPSHOT_PATH"] = ""
+    os.environ["WRITE_FLUSH_INTERVAL"] = "0.1"
+
+    history = load_results(args.out)
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+
+    for n_visits in args.visits:
+        n_customers = args.customers or max(n_visits // 10, 1)
+        print(f"\n# {n_customers} customers / {n_visits} visits", flush=True)
+
+        data = generate(n_customers, n_visits, seed=args.seed)
+        gas = FakeGas(data["customer"], data["visit"])
+        server, url = serve(gas)
+        os.environ["GAS_BASE_URL"] = url
+
+        timer = Timer()
+        try:
+            customer_df, visit_df = bench_load(timer, url, gas)
+            bench_search(timer, customer_df, visit_df)
+            if not args.skip_render:
+                bench_render(timer, gas)
+        finally:
+            server.shutdown()
+
+        result = {
+            "label": args.label,
+            "git": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "customers": n_customers,
+            "visits": n_visits,
+            "metrics": timer.metrics,
+        }
+        previous = next(
+            (r for r in reversed(history) if (r["customers"], r["visits"]) == (n_customers, n_visits)), None
+        )
+        compare(result, previous)
+
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        history.append(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+ローカル用の GAS 代替サーバ
+
+本番の Apps Script と同じ GET / POST を受け付ける。
+アプリをこのサーバに向けるには GAS_BASE_URL を指定して起動する:
+
+    $ python tools/fake_gas.py --data sample.json --port 8765
+    $ GAS_BASE_URL=http://127.0.0.1:8765/exec streamlit run streamlit_app.py
+"""
+import argparse
+import base64
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TABLE_KEYS = {"customer": "顧客_ID", "visit": "来店履歴_ID"}
+TABLE_PREFIX = {"customer": "C", "visit": "V"}
+
+
+def encode_columnar(rows):
+    """
+    行リスト → 列形式（種類の少ない列は値リスト＋番号にする）
+    """
+    columns = list(dict.fromkeys(col for row in rows for col in row))
+    values = []
+    dictionaries = {}
+    for col in columns:
+        col_values = [row.get(col) for row in rows]
+        distinct = list(dict.fromkeys(v for v in col_values if v is not None))
+        if len(distinct) * 2 <= len(rows):
+            codes = {v: i for i, v in enumerate(distinct)}
+            dictionaries[col] = distinct
+            col_values = [-1 if v is None else codes[v] for v in col_values]
+        values.append(col_values)
+    return {"columns": columns, "values": values, "dictionaries": dictionaries}
+
+
+def pack(data):
+    """
+    gzip して base64 の封筒に入れる（Apps Script の Utilities.gzip + base64Encode 相当）
+    """
+    raw = gzip.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), compresslevel=6)
+    return {"encoding": "gzip+base64", "payload": base64.b64encode(raw).decode("ascii")}
+
+
+class FakeGas:
+    """
+    シートの代わりにメモリ上で行を保持する
+    各行には更新時のリビジョンを付けておき、since 以降の行だけ返せるようにする
+    """
+
+    def __init__(self, customer=None, visit=None, delta=True, columnar=True):
+        self.delta = delta
+        self.columnar = columnar
+        self.rev = 0
+        self.tables = {"customer": {}, "visit": {}}
+        self.row_rev = {"customer": {}, "visit": {}}
+        self.reserved = {"customer": 0, "visit": 0}
+        self._lock = threading.Lock()
+
+        for name, rows in (("customer", customer), ("visit", visit)):
+            for row in rows or []:
+                self._upsert(name, row)
+
+    def _upsert(self, table, row):
+        key = str(row[TABLE_KEYS[table]])
+        self.rev += 1
+        merged = dict(self.tables[table].get(key, {}))
+        merged.update(row)
+        self.tables[table][key] = merged
+        self.row_rev[table][key] = self.rev
+
+    def _rows(self, table, since=None):
+        return [
+            row for key, row in self.tables[table].items()
+            if since is None or self.row_rev[table][key] > since
+        ]
+
+    def _reserve(self, table, count):
+        """
+        既存 ID・予約済みのどちらとも重ならない番号ブロックを返す
+        """
+        prefix = TABLE_PREFIX[table]
+        nums = [
+            int(key[len(prefix):]) for key in self.tables[table]
+            if key.startswith(prefix) and key[len(prefix):].isdigit()
+        ]
+        start = max(nums + [self.reserved[table]]) + 1
+        self.reserved[table] = start + count - 1
+        return start
+
+    # =====================
+    # GET ?action=get（&since=<rev>&table=<テーブル名>&format=columnar）
+    # =====================
+    def get(self, params):
+        with self._lock:
+            since = params.get("since")
+            since = int(since) if since not in (None, "") and self.delta else None
+
+            table = params.get("table")
+            names = [table] if table in self.tables else list(self.tables)
+
+            data = {name: self._rows(name, since) for name in names}
+            if self.delta:
+                data["rev"] = self.rev
+                data["full"] = since is None
+            if self.columnar and params.get("format") == "columnar":
+                data = pack(dict(data, **{name: encode_columnar(rows) for name, rows in data.items()
+                                          if name in self.tables}))
+            return data
+
+    # =====================
+    # POST
+    # =====================
+    def post(self, payload):
+        payload = dict(payload)
+        mode = payload.pop("mode", "")
+
+        if mode == "batch":
+            results = [self.post(item) for item in payload.get("items", [])]
+            with self._lock:
+                return {"status": "ok", "rev": self.rev, "results": results}
+
+        with self._lock:
+            if mode == "customer_only":
+                self._upsert("customer", payload)
+            elif mode == "visit_only":
+                self._upsert("visit", payload)
+            elif mode in ("customer_delete", "customer_restore"):
+                flag = "1" if mode.endswith("delete") else "0"
+                self._upsert("customer", {"顧客_ID": payload["顧客_ID"], "削除": flag})
+            elif mode in ("visit_delete", "visit_restore"):
+                flag = "1" if mode.endswith("delete") else "0"
+                self._upsert("visit", {"来店履歴_ID": payload["来店履歴_ID"], "削除": flag})
+            elif mode == "reserve_ids":
+                start = self._reserve(payload["table"], int(payload.get("count", 1)))
+                return {"status": "ok", "start": start}
+            else:
+                return {"status": "error", "message": f"unknown mode: {mode}"}
+
+            return {"status": "ok", "rev": self.rev}
+
+
+def make_handler(gas):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            params = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+            if params.get("action") != "get":
+                self._send({"status": "error", "message": "unknown action"}, 400)
+                return
+            self._send(gas.get(params))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            self._send(gas.post(payload))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(gas, host="127.0.0.1", port=0):
+    """
+    別スレッドで起動して (server, base_url) を返す
+    port=0 なら空いているポートを使う
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(gas))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/exec"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカル GAS 代替サーバ")
+    parser.add_argument("--data", help="初期データ（{\"customer\": [...], \"visit\": [...]} の JSON）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-delta", action="store_true", help="差分取得に非対応の旧 GAS として振る舞う")
+    parser.add_argument("--no-columnar", action="store_true", help="列形式に非対応の旧 GAS として振る舞う")
+    args = parser.parse_args()
+
+    data = {}
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            data = json.load(f)
+
+    gas = FakeGas(data.get("customer"), data.get("visit"), delta=not args.no_delta, columnar=not args.no_columnar)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(gas))
+    print(f"GAS_BASE_URL=http://{args.host}:{args.port}/exec")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
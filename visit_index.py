@@ -0,0 +1,100 @@
+"""
+来店履歴のインデックス
+
+visit の版ごとに1回だけ作り、顧客別・日付別の抽出を結果件数ぶんの手間で返す。
+"""
+import numpy as np
+import pandas as pd
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+NAME_COLUMNS = ["氏名", "ニックネーム"]
+
+
+def customer_names(customer_df):
+    """
+    顧客_ID → 氏名・ニックネーム（customer の版ごとに1回だけ作る）
+    """
+    names = customer_df.drop_duplicates("顧客_ID", keep="last")
+    return names.set_index("顧客_ID")[NAME_COLUMNS]
+
+
+def join_names(visit_df, names):
+    """
+    visit_df に 氏名・ニックネーム を付けた表示用ビュー
+    行の並びは visit_df と同じなので VisitIndex の行位置がそのまま使える
+    （顧客が見つからない行は NaN ＝ merge(how="left") と同じ）
+    """
+    cid = visit_df["顧客_ID"]
+    return visit_df.assign(**{col: cid.map(names[col]) for col in NAME_COLUMNS})
+
+
+class VisitIndex:
+    """
+    df は型付きの visit_df（来店日は datetime64）
+
+    by_customer        … 顧客_ID → 行位置（削除含む）
+    by_customer_active … 顧客_ID → 行位置（有効のみ）
+    by_date            … 来店日 → 行位置（有効のみ）
+    by_visit_id        … 来店履歴_ID → 行位置
+    deleted            … 削除済みの行位置
+    customer_counts    … 顧客_ID ごとの来店回数（有効のみ）
+    date_counts        … 来店日ごとの件数（有効のみ・新しい順）
+    """
+
+    def __init__(self, df):
+        self.df = df
+        active = (df["削除"] != "1").to_numpy()
+        positions = np.arange(len(df))
+        active_pos = positions[active]
+        self.deleted = positions[~active]
+        active_df = df.iloc[active_pos]
+
+        self.by_customer = df.groupby("顧客_ID", sort=False).indices
+        self.by_customer_active = {
+            cid: active_pos[pos] for cid, pos in active_df.groupby("顧客_ID", sort=False).indices.items()
+        }
+        self.by_date = {
+            day: active_pos[pos] for day, pos in active_df.groupby("来店日", sort=False).indices.items()
+        }
+
+        ids = df["来店履歴_ID"].astype(str)
+        self.by_visit_id = pd.Series(positions, index=ids.to_numpy())
+        self.by_visit_id = self.by_visit_id[~self.by_visit_id.index.duplicated(keep="last")]
+
+        self.customer_counts = pd.Series(
+            {cid: len(pos) for cid, pos in self.by_customer_active.items()}, dtype="int64"
+        )
+        self.date_counts = pd.Series(
+            {day: len(pos) for day, pos in self.by_date.items()}, dtype="int64"
+        ).sort_index(ascending=False)
+
+    def _rows(self, positions, frame=None):
+        """
+        frame … 同じ行並びのビュー（join_names の結果など）。省略時は visit_df
+        """
+        frame = self.df if frame is None else frame
+        return frame.iloc[positions if positions is not None else EMPTY]
+
+    def customer_visits(self, cid, active_only=False):
+        """
+        顧客の来店履歴（active_only=True なら削除済みを除く）
+        """
+        index = self.by_customer_active if active_only else self.by_customer
+        return self._rows(index.get(cid))
+
+    def date_visits(self, day, frame=None):
+        """
+        来店日の来店一覧（削除済みを除く）
+        """
+        return self._rows(self.by_date.get(pd.Timestamp(day)), frame)
+
+    def deleted_visits(self, frame=None):
+        return self._rows(self.deleted, frame)
+
+    def visit(self, vid):
+        """
+        来店履歴_ID の行（無ければ空のフレーム）
+        """
+        pos = self.by_visit_id.get(str(vid)) if vid else None
+        return self._rows(None if pos is None else [pos])
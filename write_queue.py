@@ -0,0 +1,183 @@
+"""
+書き込みキュー
+
+customer_only / visit_only / *_delete / *_restore をためておき、
+1回の mode: "batch" リクエストにまとめて GAS へ送る。
+
+- submit した時点で手元のフレームに反映（write-through）
+- 一定間隔（または件数上限・手動）でバックグラウンドの送信スレッドが flush
+- 結果は ticket ごとに pending → committed / failed
+- batch 非対応の GAS には1件ずつ送る
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from data_store import CUSTOMER_KEY, VISIT_KEY, WRITE_MODES
+
+
+def item_key(payload):
+    """
+    (テーブル, ID)
+    """
+    table, _ = WRITE_MODES[payload["mode"]]
+    key = CUSTOMER_KEY if table == "customer" else VISIT_KEY
+    return table, str(payload.get(key, ""))
+
+
+class WriteQueue:
+    """
+    client … gas_client.GasClient
+    store  … data_store.SheetStore
+    """
+
+    def __init__(self, client, store, max_items=50, max_results=1000):
+        self.client = client
+        self.store = store
+        self.max_items = max_items
+        self.max_results = max_results
+        self.results = {}
+        self._items = []
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        # ★ 送信は1本のワーカーで順番に（画面のスレッドは待たない）
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gas-write")
+
+    def submit(self, payload):
+        """
+        キューに積んで ticket を返す
+        直前が同じ行への上書き保存なら1件にまとめる
+        """
+        payload = dict(payload)
+        self.store.write_through(payload)
+
+        with self._lock:
+            ticket = next(self._seq)
+            table, key = item_key(payload)
+            self.results[ticket] = {
+                "status": "pending", "mode": payload["mode"], "key": key, "message": ""
+            }
+
+            last = self._items[-1] if self._items else None
+            if (last is not None and payload["mode"].endswith("_only")
+                    and last["payload"]["mode"] == payload["mode"]
+                    and item_key(last["payload"]) == (table, key)):
+                last["payload"].update(payload)
+                last["tickets"].append(ticket)
+            else:
+                self._items.append({"payload": payload, "tickets": [ticket]})
+
+            full = len(self._items) >= self.max_items
+            self._prune()
+
+        if full:
+            self.flush_async()
+        return ticket
+
+    def _prune(self):
+        """
+        古い結果を捨てる（送信待ちのものは残す）
+        """
+        extra = len(self.results) - self.max_results
+        for ticket in sorted(self.results)[:max(extra, 0)]:
+            if self.results[ticket]["status"] != "pending":
+                del self.results[ticket]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._items)
+
+    def status(self, ticket):
+        with self._lock:
+            return dict(self.results.get(ticket, {"status": "unknown", "mode": "", "key": "", "message": ""}))
+
+    def _set_result(self, item, status, message=""):
+        with self._lock:
+            for ticket in item["tickets"]:
+                self.results[ticket].update(status=status, message=message)
+
+    def _post_one(self, payload):
+        """
+        batch 非対応の GAS 向け：1件だけ送る
+        """
+        try:
+            res = self.client.post(payload)
+        except requests.RequestException as e:
+            return "failed", str(e)
+        if res.get("status", "ok") == "ok":
+            return "committed", ""
+        return "failed", str(res.get("message", ""))
+
+    def post_batch(self, payloads):
+        """
+        payloads を mode: "batch" で1回で送り、1件ごとの (status, message) を返す
+        batch 非対応の GAS には1件ずつ送る
+        batch 自体の通信エラーは requests.RequestException のまま投げる
+        """
+        res = self.client.post({"mode": "batch", "items": payloads})
+        results = res.get("results")
+        if res.get("status") != "ok" or not isinstance(results, list) or len(results) != len(payloads):
+            return [self._post_one(payload) for payload in payloads]
+        return [
+            ("committed", "") if result.get("status", "ok") == "ok"
+            else ("failed", str(result.get("message", "")))
+            for result in results
+        ]
+
+    def flush(self):
+        """
+        たまっている分を送る（送信中に積まれた分は次回）
+        すべて成功 → バックグラウンドで差分同期、失敗あり → 次回フル再同期
+        """
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, []
+            if not items:
+                return
+
+            try:
+                outcomes = self.post_batch([i["payload"] for i in items])
+            except requests.RequestException as e:
+                for item in items:
+                    self._set_result(item, "failed", str(e))
+                self.store.reset()
+                return
+
+            for item, (status, message) in zip(items, outcomes):
+                self._set_result(item, status, message)
+
+            failed = any(self.status(t)["status"] == "failed" for i in items for t in i["tickets"])
+            if failed:
+                self.store.reset()
+            else:
+                self.store.reconcile_async({item_key(i["payload"])[0] for i in items})
+
+    def flush_async(self):
+        """
+        送信スレッドで flush する（呼び出し元は待たない）
+        """
+        return self._executor.submit(self.flush)
+
+    def start(self, interval):
+        """
+        interval 秒ごとに flush するスレッドを起動（二重起動しない）
+        """
+        if self._timer is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception:
+                    # タイマーは止めない（結果は ticket 側に残る）
+                    pass
+
+        self._timer = threading.Thread(target=loop, daemon=True)
+        self._timer.start()